@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Measure what a program run costs: wall time, CPU time, and peak
+    resident memory. The kernel reports the usage when the process is
+    reaped with wait4(), but on Linux its peak memory includes the forked
+    grader's, so a student program's CPU time and memory are measured by
+    the launcher in sandbox.py, which reports them in a file. """
+
+import os
+import sys
+import tempfile
+import time
+from sandbox import kill_process_group
+
+
+def usage_from_rusage(rusage, wall_time):
+    """Return the wall time and CPU time in seconds from a
+    resource.struct_rusage. The peak memory, 'peak_rss_kb', is None: the
+    rusage of a process the grader forked includes the grader's memory."""
+    return {
+        'wall_time': round(wall_time, 4),
+        'cpu_time': round(rusage.ru_utime + rusage.ru_stime, 4),
+        'peak_rss_kb': None,
+    }
+
+
+def new_usage_report():
+    """Return the path of a new, empty report file for the launcher."""
+    handle, path = tempfile.mkstemp(prefix='grader-usage-')
+    os.close(handle)
+    return path
+
+
+def read_usage_report(report_path):
+    """Return the CPU time in seconds and the peak resident set size in
+    kilobytes the launcher wrote to report_path as a dictionary, or None
+    when the launcher was killed before writing it. The file is
+    removed."""
+    try:
+        with open(report_path, 'r', encoding='UTF-8') as file_handle:
+            cpu_time, peak_rss = file_handle.read().split()
+    except (OSError, ValueError):
+        return None
+    finally:
+        try:
+            os.unlink(report_path)
+        except OSError:
+            pass
+    peak_rss = int(peak_rss)
+    # macOS reports bytes, Linux kilobytes
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    return {'cpu_time': round(float(cpu_time), 4), 'peak_rss_kb': peak_rss}
+
+
+def combine_usage(usages):
+    """Combine the usage of several processes: the longest wall time, the
+    total CPU time, and the largest peak memory. Values that were not
+    measured are left out."""
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return None
+    cpu_times = [usage['cpu_time'] for usage in usages]
+    cpu_times = [cpu_time for cpu_time in cpu_times if cpu_time is not None]
+    peaks = [usage['peak_rss_kb'] for usage in usages]
+    peaks = [peak for peak in peaks if peak is not None]
+    return {
+        'wall_time': max(usage['wall_time'] for usage in usages),
+        'cpu_time': round(sum(cpu_times), 4) if cpu_times else None,
+        'peak_rss_kb': max(peaks) if peaks else None,
+    }
+
+
+def wait_accounted(proc, start, deadline=None, report_path=None):
+    """Reap the subprocess.Popen proc with wait4() and return a tuple of
+    whether it had to be killed at the deadline, a time.monotonic() value,
+    and its usage measured from start, a time.monotonic() value. The
+    process group is killed when the program is still running at the
+    deadline, for example after it closed its output. A proc started with
+    sandbox.launcher_argv() gets its CPU time and peak memory from
+    report_path, or None for both when the launcher was killed."""
+    timed_out = False
+    while True:
+        flags = os.WNOHANG if deadline is not None else 0
+        pid, status, rusage = os.wait4(proc.pid, flags)
+        if pid:
+            break
+        if time.monotonic() >= deadline:
+            kill_process_group(proc.pid)
+            timed_out = True
+            deadline = None
+        else:
+            time.sleep(0.005)
+    # Tell subprocess that the process is reaped.
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    usage = usage_from_rusage(rusage, time.monotonic() - start)
+    if report_path:
+        usage.update(read_usage_report(report_path) or {'cpu_time': None})
+    return (timed_out, usage)
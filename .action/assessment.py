@@ -24,16 +24,22 @@
 # POSSIBILITY OF SUCH DAMAGE.
 #
 """ Utilities to build, run, and evaluate student projects. """
+import contextlib
 import csv
 import json
 import os
 import pathlib
 import pickle
 import re
+import shlex
+import shutil
 import sys
 import subprocess
+import tempfile
+import time
 from datetime import date
 from datetime import datetime
+from execute import execute, execution_summary, reset_executions
 from checks import header_check
 from ccsrcutilities import (
     glob_all_src_files,
@@ -42,8 +48,15 @@ from ccsrcutilities import (
     lint_check,
     glob_cc_src_files,
 )
-from parse_header import dict_header, null_dict_header
-from logger import setup_logger
+from parse_header import dict_header, null_dict_header, split_partners
+from profiling import profiled
+from replay import named_path
+from logger import job_context, log_stage, setup_logger
+from events import default_event_log, emit, new_event_log, render_notes
+from gradelog import GRADELOG_FIELDS, gradelog_db_path, record_run
+from gtest_runner import run_gtests, gtest_duration_limit, slow_gtests
+from tracing import name_process, span
+from timetrace import collect_time_traces, format_time_trace_summary
 import lab_config as cfg
 
 def days_late(due_date_isoformat, last_commit_isoformat):
@@ -57,17 +70,8 @@ def days_late(due_date_isoformat, last_commit_isoformat):
 def last_commit_to_main_reflog(repository_path):
     """Using git, find the last commit in the main branch and return the date."""
     logger = setup_logger()
-    cmd = f'git -C "{repository_path}" log -1 --format=%cs'
-    logger.debug(cmd)
     status = True
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=15,
-        check=False,
-        text=True,
-    )
+    proc = execute(['git', '-C', repository_path, 'log', '-1', '--format=%cs'])
     last_commit_date = '1969-01-01'
     if proc.stdout:
         last_commit_date = str(proc.stdout).rstrip("\n\r")
@@ -82,12 +86,60 @@ def last_commit_to_main_reflog(repository_path):
     return (status, last_commit_date)
 
 
+def last_commit_hash(repository_path):
+    """Using git, return the hash of the last commit, or None when the
+    directory is not in a Git repository."""
+    proc = execute(['git', '-C', repository_path, 'rev-parse', 'HEAD'])
+    if proc.returncode != 0 or not proc.stdout:
+        return None
+    return str(proc.stdout).strip()
+
+
 def seconds_since_epoch_to_isoformat(seconds):
     """Convert seconds into an ISO format date string"""
     a_date = date.fromtimestamp(seconds)
     return a_date.isoformat()
 
 
+def scratch_root_dir():
+    """Return the directory in which grading workspaces are created. The
+    GRADER_SCRATCH_ROOT environment variable overrides the lab
+    configuration; None means the system's default temporary directory."""
+    return os.environ.get('GRADER_SCRATCH_ROOT', cfg.lab.get('scratch_root'))
+
+
+@contextlib.contextmanager
+def grading_workspace(part_dir, scratch_root=None):
+    """Copy a part's directory into a private scratch directory and yield
+    its path. Every grading job builds, links, and runs its tests inside
+    its own workspace so concurrent jobs never share object files,
+    binaries, or test output. The workspace is removed on exit."""
+    logger = setup_logger()
+    if not scratch_root:
+        scratch_root = scratch_root_dir()
+    workspace = tempfile.mkdtemp(
+        prefix=f'grade-{os.path.basename(os.path.normpath(part_dir))}-',
+        dir=scratch_root,
+    )
+    try:
+        if os.path.isdir(part_dir):
+            shutil.copytree(
+                part_dir,
+                workspace,
+                symlinks=True,
+                dirs_exist_ok=True,
+                ignore=shutil.ignore_patterns(
+                    '*.o', '*.d', 'unittest', 'test_detail.json',
+                    'compile_commands.json', '.git',
+                ),
+            )
+        logger.debug('Grading workspace for %s is %s', part_dir, workspace)
+        with named_path(workspace, 'workspace'):
+            yield workspace
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
 def make_spotless(target_dir):
     """Given a directory that contains a GNU Makefile, clean with the `make
     spotless` target."""
@@ -96,41 +148,108 @@ def make_spotless(target_dir):
     return status
 
 
-def make_build(target_dir, always_clean=True):
+def make_build(target_dir, always_clean=True, profile=None, make_vars=None):
     """Given a directory that contains a GNU Makefile, build with `make all`.
     This function call will call `make spotless` via make_spotless()"""
     status = True
     if always_clean:
         status = make_spotless(target_dir)
     if status:
-        status = make(target_dir, 'all')
+        status = make(target_dir, 'all', profile=profile, make_vars=make_vars)
     return status
 
 
-def make_unittest(
+def run_unittests(
     target_dir,
     always_clean=True,
-    output_format="json",
-    output_file="test_detail.json",
+    profile=None,
+    shards=4,
+    time_out=10,
+    max_failures=None,
+    limits=None,
 ):
-    """Given a directory that contains a GNU Makefile, build with `make unittest`.
-    This function call will call `make spotless` via make_spotless()"""
+    """Given a directory that contains a GNU Makefile, build the unit test
+    program with `make unittestbin` and run its tests in parallel shards,
+    each test with a timeout of time_out seconds. Results are read from
+    the program's output as each test ends, and a shard stops early once
+    max_failures of its tests failed. The tests run with the sandbox limits limits.
+    Returns a tuple of the list of test results, or None when there is no
+    unit test program, and the wall time, CPU time, and peak memory of
+    the test processes."""
+    logger = setup_logger()
     status = True
-    os.environ['GTEST_OUTPUT_FORMAT'] = output_format
-    os.environ['GTEST_OUTPUT_FILE'] = output_file
     if always_clean:
         status = make_spotless(target_dir)
     if status:
-        status = make(target_dir, 'unittest', time_out=120)
-    del os.environ['GTEST_OUTPUT_FORMAT']
-    del os.environ['GTEST_OUTPUT_FILE']
-    return status
+        status = make(target_dir, 'unittestbin', time_out=120, profile=profile)
+    binary = os.path.join(target_dir, 'unittest')
+    if not status or not os.path.exists(binary):
+        logger.warning('No unit test program was built in %s', target_dir)
+        return (None, None)
+    return run_gtests(
+        binary,
+        shards=shards,
+        time_out=time_out,
+        max_failures=max_failures,
+        limits=limits,
+    )
+
+
+def compare_build_profiles(part_dir, profiles=None, baseline='student'):
+    """Build a part once with each build profile, each in a fresh
+    workspace, and report how long every profile takes and how much time
+    it saves compared to the baseline profile. Returns a dictionary of
+    profile name to build time in seconds, None if the build failed."""
+    logger = setup_logger()
+    if not profiles:
+        profiles = list(cfg.build_profiles.keys())
+    build_times = {}
+    for profile in profiles:
+        with grading_workspace(part_dir) as workspace:
+            start = time.perf_counter()
+            built = make_build(workspace, profile=profile)
+            elapsed = time.perf_counter() - start
+        build_times[profile] = elapsed if built else None
+        if not built:
+            logger.warning('Build with profile %s failed.', profile)
+    baseline_time = build_times.get(baseline)
+    for profile, elapsed in build_times.items():
+        if elapsed is None:
+            continue
+        if baseline_time and profile != baseline:
+            logger.info(
+                'Profile %s: %.2fs, saves %.2fs (%.0f%%) over %s',
+                profile,
+                elapsed,
+                baseline_time - elapsed,
+                100 * (baseline_time - elapsed) / baseline_time,
+                baseline,
+            )
+        else:
+            logger.info('Profile %s: %.2fs', profile, elapsed)
+    return build_times
 
 
-def make(target_dir, make_target, time_out=30):
+def make(
+    target_dir, make_target, time_out=30, env=None, profile=None, make_vars=None
+):
     """Given a directory, execute make_target given the GNU Makefile in the
-    directory."""
+    directory. Variables in env are added to the environment of the make
+    process only. A profile names one of the build profiles in the lab
+    configuration; the Makefile's default profile is used without one.
+    make_vars are passed to make as VARIABLE=value arguments."""
+    status, _ = make_with_output(
+        target_dir, make_target, time_out, env, profile, make_vars
+    )
+    return status
+
+
+def make_with_output(
+    target_dir, make_target, time_out=30, env=None, profile=None, make_vars=None
+):
+    """Like make() but return a tuple of the status and make's stderr."""
     status = True
+    stderr = ''
     logger = setup_logger()
     makefile_name = cfg.lab['makefile_name']
     if cfg.lab['hidden_makefiles']:
@@ -139,23 +258,53 @@ def make(target_dir, make_target, time_out=30):
         logger.error('Makefile "%s" does not exist in %s', makefile_name, target_dir)
         status = False
     else:
-        cmd = f'make -f {makefile_name} -C {target_dir} {make_target}'
-        logger.debug(cmd)
-        proc = subprocess.run(
-            [cmd],
-            capture_output=True,
-            shell=True,
-            timeout=time_out,
-            check=False,
-            text=True,
+        argv = ['make', '-f', makefile_name, '-C', target_dir, make_target]
+        if profile:
+            argv.append(f'BUILD_PROFILE={profile}')
+        for name, value in (make_vars or {}).items():
+            argv.append(f'{name}={value}')
+        proc_env = None
+        if env:
+            proc_env = os.environ.copy()
+            proc_env.update(env)
+        start = time.perf_counter()
+        try:
+            proc = execute(argv, timeout=time_out, env=proc_env)
+        except subprocess.TimeoutExpired:
+            logger.error(
+                'make %s timed out after %d seconds', make_target, time_out
+            )
+            return (False, f'make {make_target} timed out after {time_out} seconds')
+        logger.debug(
+            'make %s in %s took %.2fs', make_target, target_dir,
+            time.perf_counter() - start,
         )
+        if proc.truncated:
+            logger.warning('Output of make %s was truncated', make_target)
         # if proc.stdout:
         #    logger.info('stdout: %s', str(proc.stdout).rstrip("\n\r"))
         if proc.stderr:
-            logger.info('stderr: %s', str(proc.stderr).rstrip("\n\r"))
+            stderr = str(proc.stderr).rstrip("\n\r")
+            logger.info('stderr: %s', stderr)
         if proc.returncode != 0:
             status = False
-    return status
+    return (status, stderr)
+
+
+def make_syntax_check(target_dir, profile=None, max_diagnostics=10):
+    """Check every C++ source file of the part with `make syntaxcheck`,
+    which only parses the files (-fsyntax-only). This is much cheaper than
+    linting, building, and testing, so it runs first. Returns a tuple of
+    the status and the first max_diagnostics error lines."""
+    status, stderr = make_with_output(target_dir, 'syntaxcheck', profile=profile)
+    error_lines = [
+        line for line in stderr.splitlines()
+        if 'error' in line and not line.startswith('make')
+    ]
+    if not status and not error_lines:
+        # e.g. a timeout or a missing Makefile
+        error_lines = stderr.splitlines()
+    return (status, '\n'.join(error_lines[:max_diagnostics]))
 
 
 def build(
@@ -171,16 +320,10 @@ def build(
     if os.path.exists(target):
         os.unlink(target)
     status = True
-    cmd = compile_cmd.format(target, file)
-    logger.debug(cmd)
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=compiletimeout,
-        check=False,
-        text=True,
-    )
+    # Split the template before filling it in so that paths with spaces
+    # stay one argument.
+    argv = [arg.format(target, file) for arg in shlex.split(compile_cmd)]
+    proc = execute(argv, timeout=compiletimeout)
     if proc.stdout:
         logger.info('stdout: %s', str(proc.stdout).rstrip("\n\r"))
     if proc.stderr:
@@ -225,10 +368,42 @@ def csv_solution_check_make(
     tidy_options=None,
     skip_compile_cmd=False,
     lab_due_date=None,
+    scratch_root=None,
+    build_profile=None,
+    syntax_precheck=True,
+    on_syntax_error='skip',
+    time_trace=False,
+    unittest_shards=4,
+    unittest_timeout=10,
+    unittest_max_failures=None,
+    unittest_max_duration_ms=500,
+    unittest_slow_fraction=0.8,
+    sandbox_limits=None,
+    gradelog_db=None,
+    event_log=None,
 ):
     """Main function for checking student's solution. Provide a pointer to a
-    run function."""
+    run function which returns a list with a dictionary for each test run
+    that has at least the key 'passed'.
+    When syntax_precheck is True, the sources are parsed first and
+    on_syntax_error decides what happens to a submission that does not
+    compile: 'skip' skips linting, unit tests, and the build; 'downgrade'
+    lints without a compile commands DB and skips unit tests and the build;
+    'continue' runs every stage anyway.
+    With time_trace, or GRADER_TIME_TRACE=1 in the environment, the build
+    records clang's -ftime-trace and the compile time of each file is
+    summarized in the notes.
+    The unit tests run with sandbox_limits, which override
+    sandbox.DEFAULT_LIMITS.
+    The row is written to the part's gradelog CSV and, with gradelog_db,
+    appended to that database as a new grading run, see
+    gradelog.gradelog_db_path().
+    Every stage records events, appended to the JSONL file event_log, by
+    default next to the gradelog CSV; the notes are rendered from them.
+    GRADER_PROFILE and GRADER_TRACEMALLOC profile the grading, see
+    profiling.py."""
     logger = setup_logger()
+    time_trace = time_trace or os.environ.get('GRADER_TIME_TRACE') == '1'
 
     students_dict = None
 
@@ -272,31 +447,27 @@ def csv_solution_check_make(
     csv_path = os.path.join(repo_root, csv_filename)
     # print(f'csv_path: {csv_path}')
     # End more problems here.
-    csv_fields = [
-        'Repo Name',
-        'Part',
-        'Author',
-        'Partner1',
-        'Partner2',
-        'Partner3',
-        'PartnerN',
-        'Header',
-        'Formatting',
-        'Linting',
-        'Build',
-        'Tests',
-        'UnitTests',
-        'Notes',
-        'UnitTestNotes',
-        'DaysLate',
-    ]
     status = 0
-    with open(csv_path, 'w', encoding='UTF-8') as csv_output_handle:
-        outcsv = csv.DictWriter(csv_output_handle, csv_fields)
+    name_process(f'{repo_name} {part_name}')
+    # Account for the processes started for this submission only.
+    reset_executions()
+    # Everything that writes to the file system (compile databases, object
+    # files, binaries, unit test output) happens in a private workspace.
+    with job_context(repo_name, part_name), \
+            profiled(repo_root, repo_name, part_name), \
+            span('grade', 'job', repo=repo_name, part=part_name), \
+            open(csv_path, 'w', encoding='UTF-8') as csv_output_handle, \
+            grading_workspace(abs_path_target_dir, scratch_root) as workspace:
+        outcsv = csv.DictWriter(csv_output_handle, GRADELOG_FIELDS)
         outcsv.writeheader()
         row = {}
         row['Repo Name'] = repo_name
         row['Part'] = part_name
+        events = new_event_log(
+            repo_name,
+            part_name,
+            event_log or default_event_log(repo_root, repo_name, part_name),
+        )
         if not lab_due_date:
             # set a default date that is safe
             lab_due_date = date.today().isoformat()
@@ -306,8 +477,6 @@ def csv_solution_check_make(
         if not valid_date:
             last_commit = date.today().isoformat()
         row['DaysLate'] = days_late(lab_due_date, last_commit)
-        # Init to empty string so you're always adding notes.
-        row['Notes'] = ''
         if not files:
             # This could be a target in the Makefile
             files = glob_all_src_files(target_directory)
@@ -323,7 +492,7 @@ def csv_solution_check_make(
             row['Linting'] = 0
             row['Build'] = 0
             row['Tests'] = 0
-            row['Notes'] = f"❌ No files in {target_directory}."
+            emit(events, 'files', 'fail', f'No files in {target_directory}.')
             status = 1
         else:
             # Header checks
@@ -342,10 +511,12 @@ def csv_solution_check_make(
                 row['Linting'] = 0
                 row['Build'] = 0
                 row['Tests'] = 0
-                all_files = ' '.join(files)
-                row[
-                    'Notes'
-                ] = f'❌ No header provided in any file in {target_directory}.'
+                emit(
+                    events,
+                    'header',
+                    'fail',
+                    f'No header provided in any file in {target_directory}.',
+                )
                 status = 1
             else:
                 row['Header'] = 1
@@ -359,13 +530,7 @@ def csv_solution_check_make(
                 file for file in files if not header_check(file)
             ]
             row['Author'] = header['github'].replace('@', '').lower()
-            partners = (
-                header['partners']
-                .replace(',', ' ')
-                .replace('@', '')
-                .lower()
-                .split()
-            )
+            partners = split_partners(header['partners'])
 
             for num, name in enumerate(partners, start=1):
                 key = f'Partner{num}'
@@ -382,9 +547,13 @@ def csv_solution_check_make(
                 logger.warning(
                     'Files missing headers: %s', files_missing_header_str
                 )
-                row['Notes'] = (
-                    row['Notes']
-                    + f'❌Files missing headers: {files_missing_header_str}\n'
+                for file in files_missing_header:
+                    emit(events, 'header', 'fail', file=file)
+                emit(
+                    events,
+                    'header',
+                    'fail',
+                    f'Files missing headers: {files_missing_header_str}',
                 )
                 status = 1
             # Check if files have changed
@@ -403,12 +572,47 @@ def csv_solution_check_make(
             else:
                 logger.debug('Skipping base file comparison.')
 
+            # Syntax check; a submission that does not compile cannot pass
+            # the costly stages so they are skipped per on_syntax_error.
+            skip_costly_stages = False
+            if syntax_precheck:
+                start = time.perf_counter()
+                with span('syntax check'), log_stage('syntax'):
+                    compiles, diagnostics = make_syntax_check(
+                        workspace, profile=build_profile
+                    )
+                duration = time.perf_counter() - start
+                if compiles:
+                    logger.info('✅ Syntax check passed')
+                    emit(events, 'syntax', 'pass', duration=duration)
+                else:
+                    logger.error('❌ Syntax check failed')
+                    emit(
+                        events,
+                        'syntax',
+                        'fail',
+                        f'Syntax check failed:\n{diagnostics}',
+                        duration=duration,
+                        diagnostics=diagnostics.splitlines(),
+                    )
+                    status = 1
+                    skip_costly_stages = on_syntax_error in ('skip', 'downgrade')
+            if skip_costly_stages:
+                logger.warning(
+                    'Submission does not compile; %s costly stages',
+                    on_syntax_error,
+                )
+
             # Format
             if do_format_check:
                 count = 0
                 for file in files:
+                    start = time.perf_counter()
                     try:
-                        diff = format_check(file)
+                        with span('format', file=os.path.basename(file)), \
+                                log_stage('format'):
+                            diff = format_check(file)
+                        duration = time.perf_counter() - start
                         if len(diff) != 0:
                             logger.warning(
                                 '❌ Formatting needs improvement in %s.',
@@ -418,9 +622,15 @@ def csv_solution_check_make(
                                 'Please make sure your code conforms to the Google C++ style.'
                             )
                             logger.debug('\n'.join(diff))
-                            row['Notes'] = (
-                                row['Notes']
-                                + f'❌ Formatting needs improvement in {os.path.basename(file)}.\n'
+                            emit(
+                                events,
+                                'format',
+                                'fail',
+                                'Formatting needs improvement in '
+                                f'{os.path.basename(file)}.',
+                                file=file,
+                                duration=duration,
+                                diff_lines=len(diff),
                             )
                             status = 1
                         else:
@@ -428,11 +638,16 @@ def csv_solution_check_make(
                                 '✅ Formatting passed on %s',
                                 os.path.basename(file),
                             )
+                            emit(events, 'format', 'pass', file=file, duration=duration)
                             count += 1
                     except ChildProcessError:
                         logger.warning('❌ clang-format is not executable')
-                        row['Notes'] = (
-                            row['Notes'] + '❌ clang-format is not executable\n'
+                        emit(
+                            events,
+                            'format',
+                            'fail',
+                            'clang-format is not executable',
+                            file=file,
                         )
                         status = 1
                 row['Formatting'] = f'{count}/{len(files)}'
@@ -440,27 +655,45 @@ def csv_solution_check_make(
                 row['Formatting'] = 'Skipped'
 
             # Lint
-            if do_lint_check:
+            if do_lint_check and skip_costly_stages and on_syntax_error == 'skip':
+                row['Linting'] = 'Skipped'
+            elif do_lint_check:
                 count = 0
+                # Without a build, querying make for the compile command
+                # is wasted effort.
+                lint_skip_compile_cmd = skip_compile_cmd or skip_costly_stages
                 for file in files:
-                    lint_warnings = lint_check(
-                        file, tidy_options, skip_compile_cmd
-                    )
+                    start = time.perf_counter()
+                    with span('lint', file=os.path.basename(file)), \
+                            log_stage('lint'):
+                        lint_warnings = lint_check(
+                            file,
+                            tidy_options,
+                            lint_skip_compile_cmd,
+                            build_dir=workspace,
+                        )
+                    duration = time.perf_counter() - start
                     if len(lint_warnings) != 0:
                         logger.warning(
                             '❌ Linter found improvements in %s.',
                             os.path.basename(file),
                         )
                         logger.debug('\n'.join(lint_warnings))
-                        row['Notes'] = (
-                            row['Notes']
-                            + f'❌ Linter found improvements in {os.path.basename(file)}.\n'
+                        emit(
+                            events,
+                            'lint',
+                            'fail',
+                            f'Linter found improvements in {os.path.basename(file)}.',
+                            file=file,
+                            duration=duration,
+                            warnings=len(lint_warnings),
                         )
                         status = 1
                     else:
                         logger.info(
                             '✅ Linting passed in %s', os.path.basename(file)
                         )
+                        emit(events, 'lint', 'pass', file=file, duration=duration)
                         count += 1
                 row['Linting'] = f'{count}/{len(files)}'
             else:
@@ -469,59 +702,97 @@ def csv_solution_check_make(
             # We don't know if there are unit tests in this project
             # or not. We'll assume there are and then check to see
             # if an output file was created.
-            if do_unit_tests:
-                logger.info('✅ Attempting unit tests')
-                unit_test_output_file = "test_detail.json"
-                # XXX
-                # make_unittest(target_directory, output_file=unit_test_output_file)
-                make_unittest(
-                    abs_path_target_dir, output_file=unit_test_output_file
+            if do_unit_tests and skip_costly_stages:
+                row['UnitTests'] = '0/0'
+                emit(
+                    events,
+                    'unittest',
+                    'info',
+                    'Unit tests skipped; the submission does not compile.',
                 )
-                # make_unittest('.', output_file=unit_test_output_file)
-                unit_test_output_path = os.path.join(
-                    target_directory, unit_test_output_file
-                )
-                if not os.path.exists(unit_test_output_path):
-                    unit_test_output_path = os.path.join(
-                        '.', unit_test_output_file
+            elif do_unit_tests:
+                logger.info('✅ Attempting unit tests')
+                start = time.perf_counter()
+                with span('unit tests'), log_stage('unittest'):
+                    unit_test_results, unit_test_usage = run_unittests(
+                        workspace,
+                        profile=build_profile,
+                        shards=unittest_shards,
+                        time_out=unittest_timeout,
+                        max_failures=unittest_max_failures,
+                        limits=sandbox_limits,
                     )
-                    
-                if os.path.exists(unit_test_output_path):
+                if unit_test_results:
                     logger.info('✅ Unit test output found')
-                    with open(
-                        unit_test_output_path, 'r', encoding='UTF-8'
-                    ) as json_fh:
-                        unit_test_results = json.load(json_fh)
-                        total_tests = unit_test_results['tests']
-                        failures = unit_test_results.get('failures', 0)
-                        passed_tests = total_tests - failures
-                        if failures > 0:
-                            logger.error(
-                                '❌ One or more unit tests failed (%d/%d)',
-                                passed_tests,
-                                total_tests,
+                    total_tests = len(unit_test_results)
+                    passed_tests = sum(
+                        result['passed'] for result in unit_test_results
+                    )
+                    failures = total_tests - passed_tests
+                    if failures > 0:
+                        logger.error(
+                            '❌ One or more unit tests failed (%d/%d)',
+                            passed_tests,
+                            total_tests,
+                        )
+                    else:
+                        logger.info('✅ Passed all unit tests')
+                    row['UnitTests'] = f'{passed_tests}/{total_tests}'
+                    emit(
+                        events,
+                        'unittest',
+                        'pass' if failures == 0 else 'fail',
+                        duration=time.perf_counter() - start,
+                        passed=passed_tests,
+                        total=total_tests,
+                    )
+                    for result in unit_test_results:
+                        name, _, inner_name = result['name'].partition('.')
+                        for this_fail in result['failures']:
+                            unit_test_note = f'{name}:{inner_name}:{this_fail}'
+                            emit(
+                                events,
+                                'unittest',
+                                'fail',
+                                unit_test_note,
+                                test=result['name'],
                             )
-                        else:
-                            logger.info('✅ Passed all unit tests')
-                        row['UnitTests'] = f'{passed_tests}/{total_tests}'
-                        row['UnitTestNotes'] = ""
-                        for test_suite in unit_test_results['testsuites']:
-                            name = test_suite['name']
-                            for inner_suite in test_suite['testsuite']:
-                                inner_name = inner_suite['name']
-                                if 'failures' in inner_suite:
-                                    for fail in inner_suite['failures']:
-                                        this_fail = fail['failure']
-                                        unit_test_note = (
-                                            f'{name}:{inner_name}:{this_fail}\n'
-                                        )
-                                        row['UnitTestNotes'] = (
-                                            row['UnitTestNotes']
-                                            + unit_test_note
-                                        )
-                                        logger.error('❌ %s', unit_test_note)
+                            logger.error('❌ %s', unit_test_note)
+                    # Milliseconds per test; None for a test that did not
+                    # finish.
+                    row['UnitTestTimes'] = json.dumps(
+                        {
+                            result['name']: result['time_ms']
+                            for result in unit_test_results
+                        }
+                    )
+                    # Wall and CPU seconds and peak memory in kilobytes
+                    # of all the unit test processes
+                    row['UnitTestUsage'] = json.dumps(unit_test_usage)
+                    limit_ms = gtest_duration_limit(
+                        os.path.join(workspace, f'{program_name}_unittest.cc'),
+                        unittest_max_duration_ms,
+                    )
+                    for result in slow_gtests(
+                        unit_test_results, limit_ms, unittest_slow_fraction
+                    ):
+                        name, _, inner_name = result['name'].partition('.')
+                        slow_note = (
+                            f"{name}:{inner_name}:took {result['time_ms']} ms "
+                            f'of the {limit_ms} ms limit'
+                        )
+                        emit(
+                            events,
+                            'unittest',
+                            'warn',
+                            slow_note,
+                            test=result['name'],
+                            time_ms=result['time_ms'],
+                            limit_ms=limit_ms,
+                        )
+                        logger.warning('Slow unit test %s', slow_note)
             else:
-                row['UnitTestNotes'] = "Unit tests disabled."
+                emit(events, 'unittest', 'info', 'Unit tests disabled.')
             main_src_file = None
             for file in files:
                 if has_main_function(file):
@@ -529,17 +800,23 @@ def csv_solution_check_make(
                     if not main_src_file:
                         main_src_file = file
                         logger.info('Main function found in %s', short_file)
-                        row['Notes'] = (
-                            row['Notes']
-                            + f'Main function found in {short_file}\n'
+                        emit(
+                            events,
+                            'main',
+                            'info',
+                            f'Main function found in {short_file}',
+                            file=file,
                         )
                     else:
                         logger.warning(
                             '❌ Extra main function found in %s', short_file
                         )
-                        row['Notes'] = (
-                            row['Notes']
-                            + f'❌ Extra main function found in {short_file}\n'
+                        emit(
+                            events,
+                            'main',
+                            'fail',
+                            f'Extra main function found in {short_file}',
+                            file=file,
                         )
             if not main_src_file:
                 # This is going to use long paths
@@ -547,41 +824,106 @@ def csv_solution_check_make(
                 logger.warning(
                     '❌ No main function found in files: %s', files_str
                 )
-                row['Notes'] = (
-                    row['Notes']
-                    + f'❌ No main function found in files: {files_str}\n'
+                emit(
+                    events,
+                    'main',
+                    'fail',
+                    f'No main function found in files: {files_str}',
                 )
 
             # Clean, Build, & Run
-            # XXX
-            # if main_src_file and make_build(target_directory):
-            # if main_src_file and make_build('.'):
-            if main_src_file and make_build(abs_path_target_dir):
+            built = False
+            build_duration = None
+            if main_src_file and not skip_costly_stages:
+                start = time.perf_counter()
+                with span('build'), log_stage('build'):
+                    built = make_build(
+                        workspace,
+                        profile=build_profile,
+                        make_vars={'TIME_TRACE': 1} if time_trace else None,
+                    )
+                build_duration = time.perf_counter() - start
+            if skip_costly_stages:
+                logger.error('❌ Build skipped')
+                row['Build'] = 0
+                emit(events, 'build', 'fail', 'Build failed', skipped=True)
+                row['Tests'] = '0/0'
+                status = 1
+            elif built:
                 logger.info('✅ Build passed')
+                emit(events, 'build', 'pass', duration=build_duration)
                 row['Build'] = 1
                 # Run
-                program_name = os.path.join(
-                    os.path.dirname(os.path.abspath(main_src_file)),
-                    program_name,
-                )
-                run_stats = run(program_name)
+                program_name = os.path.join(workspace, program_name)
+                start = time.perf_counter()
+                with span('run'), log_stage('run'):
+                    run_records = run(program_name)
+                run_duration = time.perf_counter() - start
+                run_stats = [record['passed'] for record in run_records]
+                # The timeout each run was given is kept so that failures
+                # caused by a loaded host can be told apart.
+                row['TestDetails'] = json.dumps(run_records)
                 # passed tests / total tests
                 test_notes = f'{sum(run_stats)}/{len(run_stats)}'
                 if all(run_stats):
                     logger.info('✅ All test runs passed')
+                    emit(
+                        events,
+                        'run',
+                        'pass',
+                        duration=run_duration,
+                        passed=sum(run_stats),
+                        total=len(run_stats),
+                    )
                 else:
                     logger.error('❌ One or more runs failed (%s)', test_notes)
-                    row['Notes'] = (
-                        row['Notes'] + '❌ One or more test runs failed\n'
+                    emit(
+                        events,
+                        'run',
+                        'fail',
+                        'One or more test runs failed',
+                        duration=run_duration,
+                        passed=sum(run_stats),
+                        total=len(run_stats),
+                        failed_tests=[
+                            record['test']
+                            for record in run_records
+                            if not record['passed']
+                        ],
                     )
                     status = 1
                 row['Tests'] = test_notes
             else:
                 logger.error('❌ Build failed')
                 row['Build'] = 0
-                row['Notes'] = row['Notes'] + '❌ Build failed\n'
+                emit(events, 'build', 'fail', 'Build failed', duration=build_duration)
                 row['Tests'] = '0/0'
                 status = 1
+            if time_trace and main_src_file and not skip_costly_stages:
+                # Traces of the files that finished compiling survive a
+                # build that timed out.
+                src_files = [file for file in files if file.endswith('.cc')]
+                summary_lines = format_time_trace_summary(
+                    collect_time_traces(workspace, src_files)
+                )
+                for line in summary_lines:
+                    logger.info('Compile time: %s', line)
+                    emit(events, 'timetrace', 'info', f'Compile time: {line}')
             logger.info('End %s', identify(header))
+        tools = execution_summary()
+        logger.info(
+            'Started %d processes: %s',
+            sum(tool['count'] for tool in tools.values()),
+            ', '.join(f"{name} x{tool['count']}" for name, tool in tools.items()),
+        )
+        emit(events, 'processes', 'pass', tools=tools)
+        row['Notes'] = render_notes(events['events'])
+        row['UnitTestNotes'] = render_notes(events['events'], unittest=True)
         outcsv.writerow(row)
+    if gradelog_db:
+        record_run(
+            gradelog_db_path(gradelog_db, repo_root),
+            row,
+            commit_hash=last_commit_hash(abs_path_target_dir),
+        )
     sys.exit(status)
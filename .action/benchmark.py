@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Measure how fast the grader grades a cohort. A synthetic cohort of
+    student repositories is made from this lab's starter files with a
+    controlled mix of correct, broken, unformatted, and slow submissions,
+    every part of every repository is graded with solution_check.py as
+    the fleet would, and the throughput, the time of each stage, and the
+    peak memory are reported and stored so that runs can be compared.
+
+    Correct submissions use the solutions in a directory laid out like
+    the repository (solutions/part-2/blackjack.cc, ...) when one is
+    given; otherwise the starter files stand in for them.
+
+    ex.
+    .action/benchmark.py 40
+    .action/benchmark.py 40 --jobs 8 --solutions ~/lab-6-solutions
+    .action/benchmark.py 40 --compare .benchmarks/20231018-101500.json
+"""
+
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from accounting import new_usage_report, read_usage_report
+from datetime import datetime
+from events import default_event_log, read_events
+from execute import execute
+from logger import setup_logger
+from sandbox import launcher_argv
+from unittest_timing import percentile
+
+import lab_config as cfg
+
+# Share of each kind of submission in the cohort
+DEFAULT_MIX = {'correct': 0.6, 'broken': 0.15, 'unformatted': 0.15, 'slow': 0.1}
+# Seconds one part may take to grade before the job is killed
+JOB_TIMEOUT = 600
+# Where results are stored, relative to the working directory
+RESULTS_DIR = '.benchmarks'
+# A slow submission spends about this long in a static initializer every
+# time the program runs.
+SLOW_LOOP = (
+    '\nstatic const int kBenchmarkSlow = [] {\n'
+    '  for (volatile long i = 0; i < 100000000; ++i) {\n'
+    '  }\n'
+    '  return 0;\n'
+    '}();\n'
+)
+
+_ACTION_DIR = os.path.dirname(os.path.abspath(__file__))
+_REPO_ROOT = os.path.dirname(_ACTION_DIR)
+
+
+def cohort_kinds(count, mix=None, seed=0):
+    """Return the kind of each of count submissions, in proportion to mix
+    and shuffled with seed."""
+    mix = mix or DEFAULT_MIX
+    kinds = []
+    for kind, share in mix.items():
+        kinds += [kind] * round(share * count)
+    kinds = (kinds + ['correct'] * count)[:count]
+    random.Random(seed).shuffle(kinds)
+    return kinds
+
+
+def student_header(number):
+    """The header comment of a synthetic student's files."""
+    return (
+        f'// Student {number}\n'
+        f'// student{number}@csu.fullerton.edu\n'
+        f'// @student{number}\n'
+        '// Partners: \n'
+    )
+
+
+def _with_header(source, header):
+    """Put header at the top of source in place of the starter's TODO."""
+    lines = source.splitlines(keepends=True)
+    if lines and lines[0].startswith('// TODO: Add the required header'):
+        lines = lines[1:]
+    return header + ''.join(lines)
+
+
+def make_submission(repo_dir, number, kind, solutions_dir=None):
+    """Create a student repository in repo_dir from the starter files
+    with a submission of the given kind: 'correct', 'broken' (does not
+    compile), 'unformatted', or 'slow'."""
+    os.makedirs(repo_dir)
+    header = student_header(number)
+    for index, part in enumerate(cfg.lab['parts'], start=1):
+        part_name = f'part-{index}'
+        part_dir = os.path.join(repo_dir, part_name)
+        shutil.copytree(os.path.join(_REPO_ROOT, part_name), part_dir)
+        solution_dir = os.path.join(solutions_dir or '', part_name)
+        graded = part['src'].split() + part['header'].split()
+        for file_name in graded:
+            path = os.path.join(part_dir, file_name)
+            solution = os.path.join(solution_dir, file_name)
+            if solutions_dir and os.path.exists(solution):
+                path_in = solution
+            else:
+                path_in = path
+            with open(path_in, 'r', encoding='UTF-8') as file_handle:
+                source = _with_header(file_handle.read(), header)
+            if file_name == graded[0]:
+                if kind == 'broken':
+                    source += '\nint broken(\n'
+                elif kind == 'slow':
+                    source += SLOW_LOOP
+            if kind == 'unformatted':
+                source = ''.join(line.lstrip(' ') for line in source.splitlines(True))
+            with open(path, 'w', encoding='UTF-8') as file_handle:
+                file_handle.write(source)
+    execute(['git', 'init', '-q', repo_dir])
+    execute(['git', '-C', repo_dir, 'add', '-A'])
+    execute(
+        [
+            'git', '-C', repo_dir,
+            '-c', 'user.name=Benchmark', '-c', 'user.email=benchmark@localhost',
+            'commit', '-q', '-m', f'{kind} submission',
+        ]
+    )
+
+
+def make_cohort(cohort_dir, count, mix=None, solutions_dir=None, seed=0):
+    """Create count student repositories in cohort_dir and return a list
+    of (repository, kind) tuples."""
+    cohort = []
+    for number, kind in enumerate(cohort_kinds(count, mix, seed)):
+        repo_dir = os.path.join(cohort_dir, f'student-{number:04d}')
+        make_submission(repo_dir, number, kind, solutions_dir)
+        cohort.append((repo_dir, kind))
+    return cohort
+
+
+def grade_part(repo_dir, part_name, time_out=JOB_TIMEOUT):
+    """Grade one part of a repository as the fleet does and return the
+    job's wall time, peak memory, stage durations, and whether it had to
+    be killed after time_out seconds."""
+    logger = setup_logger()
+    start = time.perf_counter()
+    report_path = new_usage_report()
+    argv = [sys.executable, os.path.join(_ACTION_DIR, 'solution_check.py'), part_name]
+    try:
+        proc = execute(
+            launcher_argv(argv, report_path=report_path),
+            timeout=time_out,
+            cwd=repo_dir,
+        )
+    except subprocess.TimeoutExpired:
+        logger.warning('Grading %s %s timed out', repo_dir, part_name)
+        read_usage_report(report_path)
+        return {
+            'wall_time': time.perf_counter() - start,
+            'peak_rss_kb': None,
+            'returncode': None,
+            'timed_out': True,
+            'stages': {},
+        }
+    wall_time = time.perf_counter() - start
+    # The launcher measures the job and the tools it waited for.
+    usage = read_usage_report(report_path) or {}
+    stages = {}
+    event_log = default_event_log(repo_dir, os.path.basename(repo_dir), part_name)
+    if os.path.exists(event_log):
+        for event in read_events([event_log]):
+            if event['duration'] is not None:
+                stage = event['stage']
+                stages[stage] = stages.get(stage, 0) + event['duration']
+    return {
+        'wall_time': wall_time,
+        'peak_rss_kb': usage.get('peak_rss_kb'),
+        'returncode': proc.returncode,
+        'timed_out': False,
+        'stages': stages,
+    }
+
+
+def _distribution(values):
+    """p50 and p95 of a list of numbers, in seconds."""
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None}
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 0.5), 4),
+        'p95': round(percentile(values, 0.95), 4),
+    }
+
+
+def run_benchmark(count, jobs=None, mix=None, solutions_dir=None, seed=0):
+    """Grade a synthetic cohort of count repositories, jobs parts at a
+    time, and return the results."""
+    logger = setup_logger()
+    jobs = jobs or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory(prefix='grader-benchmark-') as cohort_dir:
+        cohort = make_cohort(cohort_dir, count, mix, solutions_dir, seed)
+        grading = [
+            (repo_dir, kind, f'part-{index}')
+            for repo_dir, kind in cohort
+            for index in range(1, len(cfg.lab['parts']) + 1)
+        ]
+        logger.info('Grading %d parts, %d at a time', len(grading), jobs)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(
+                executor.map(lambda job: grade_part(job[0], job[2]), grading)
+            )
+        elapsed = time.perf_counter() - start
+    # Jobs that timed out count neither towards throughput nor timings.
+    timed_out = sum(result['timed_out'] for result in results)
+    results = [result for result in results if not result['timed_out']]
+    graded = count * len(results) / len(grading) if grading else 0
+    stage_times = {}
+    for result in results:
+        for stage, duration in result['stages'].items():
+            stage_times.setdefault(stage, []).append(duration)
+    kinds = {}
+    for _, kind in cohort:
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'host': os.uname().nodename,
+        'submissions': count,
+        'parts': len(grading),
+        'jobs': jobs,
+        'kinds': kinds,
+        'timed_out': timed_out,
+        'elapsed': round(elapsed, 2),
+        'submissions_per_minute': round(60 * graded / elapsed, 2),
+        'job_time': _distribution([result['wall_time'] for result in results]),
+        'stages': {
+            stage: _distribution(times) for stage, times in sorted(stage_times.items())
+        },
+        'peak_rss_kb': max(
+            (result['peak_rss_kb'] or 0 for result in results), default=0
+        ),
+        'benchmark_peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def save_results(results, results_dir=RESULTS_DIR):
+    """Store the results as JSON named after the time of the run and
+    return the file's path."""
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(results_dir, f'{stamp}.json')
+    with open(path, 'w', encoding='UTF-8') as file_handle:
+        json.dump(results, file_handle, indent=2)
+    return path
+
+
+def format_results(results, baseline=None):
+    """Return the report of a run as a list of lines, with the change
+    from a baseline run when one is given."""
+
+    def change(new, old):
+        if not old or new is None:
+            return ''
+        return f' ({100 * (new - old) / old:+.1f}%)'
+
+    base_stages = (baseline or {}).get('stages', {})
+    lines = [
+        f"{results['submissions']} submissions ({results['parts']} parts) "
+        f"in {results['elapsed']}s with {results['jobs']} jobs: "
+        + ', '.join(f'{count} {kind}' for kind, count in results['kinds'].items())
+        + f", {results.get('timed_out', 0)} parts timed out",
+        f"Submissions per minute: {results['submissions_per_minute']}"
+        + change(
+            results['submissions_per_minute'],
+            (baseline or {}).get('submissions_per_minute'),
+        ),
+        f"Peak memory of a grading job: {results['peak_rss_kb']} KB"
+        + change(results['peak_rss_kb'], (baseline or {}).get('peak_rss_kb')),
+        f"{'Stage':12} {'N':>5} {'p50 s':>9} {'p95 s':>9}",
+    ]
+    for stage, stats in [('job', results['job_time'])] + list(
+        results['stages'].items()
+    ):
+        if stage == 'job':
+            old = (baseline or {}).get('job_time')
+        else:
+            old = base_stages.get(stage)
+        p50, p95 = (
+            str(stats[key]) if stats['count'] else '-' for key in ('p50', 'p95')
+        )
+        lines.append(
+            f"{stage:12} {stats['count']:>5} {p50:>9} {p95:>9}"
+            + change(stats['p50'], (old or {}).get('p50'))
+        )
+    return lines
+
+
+def main():
+    """Run the benchmark with the number of repositories given on the
+    command line and store the results in .benchmarks."""
+    logger = setup_logger()
+    args = sys.argv[1:]
+    options = {}
+    for name in ('--jobs', '--solutions', '--compare', '--seed'):
+        if name in args:
+            index = args.index(name)
+            options[name] = args[index + 1]
+            del args[index:index + 2]
+    if len(args) != 1 or not args[0].isdigit():
+        logger.error(
+            'Usage: %s COUNT [--jobs N] [--solutions DIR] [--compare FILE]',
+            sys.argv[0],
+        )
+        sys.exit(1)
+    baseline = None
+    if '--compare' in options:
+        with open(options['--compare'], 'r', encoding='UTF-8') as file_handle:
+            baseline = json.load(file_handle)
+    results = run_benchmark(
+        int(args[0]),
+        jobs=int(options.get('--jobs', 0)) or None,
+        solutions_dir=options.get('--solutions'),
+        seed=int(options.get('--seed', 0)),
+    )
+    print('\n'.join(format_results(results, baseline)))
+    logger.info('Results stored in %s', save_results(results))
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
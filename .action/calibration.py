@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+""" Timeouts for program runs that adapt to the grading host. A short
+    calibration run measures how much slower this host is than a nominal
+    one, the current load average scales that further, and a test's
+    timeout grows with the reference solution's measured runtime. """
+
+import json
+import os
+import os.path
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+from logger import setup_logger
+
+# What the calibration workloads take on an unloaded, reasonably fast host
+NOMINAL_SPAWN_SECONDS = 0.001
+NOMINAL_CPU_SECONDS = 0.05
+
+# Recalibrate once a day
+CALIBRATION_MAX_AGE = 24 * 60 * 60
+
+# The most the load average may scale timeouts. The load includes the
+# grader's own jobs, so an uncapped factor feeds back on itself: slower
+# grading raises the load, which raises the timeouts.
+MAX_LOAD_FACTOR = 2.0
+
+
+def calibration_cache_path():
+    """Where each host's calibration is kept; GRADER_CALIBRATION_CACHE
+    overrides the default in the user's cache directory."""
+    return os.environ.get(
+        'GRADER_CALIBRATION_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'grader-calibration.json'),
+    )
+
+
+def measure_host_factor(runs=20):
+    """Measure how many times slower this host is than the nominal host at
+    starting a process and at a fixed amount of computation. Never less
+    than 1."""
+    true_binary = shutil.which('true') or '/bin/true'
+    spawn_times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([true_binary], check=False)
+        spawn_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    total = 0
+    for number in range(1000000):
+        total += number
+    cpu_time = time.perf_counter() - start
+    return max(
+        1.0,
+        statistics.median(spawn_times) / NOMINAL_SPAWN_SECONDS,
+        cpu_time / NOMINAL_CPU_SECONDS,
+    )
+
+
+def host_factor(cache_path=None):
+    """Return this host's calibration factor, measuring it when the cached
+    value is missing or stale."""
+    logger = setup_logger()
+    if not cache_path:
+        cache_path = calibration_cache_path()
+    host = socket.gethostname()
+    cache = {}
+    try:
+        with open(cache_path, 'r', encoding='UTF-8') as file_handle:
+            cache = json.load(file_handle)
+        entry = cache.get(host)
+        if entry and time.time() - entry['measured'] < CALIBRATION_MAX_AGE:
+            return entry['factor']
+    except (OSError, ValueError, KeyError):
+        pass
+    factor = measure_host_factor()
+    logger.debug('Host %s calibrated at %.2f times nominal', host, factor)
+    cache[host] = {'factor': factor, 'measured': time.time()}
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)))
+        with os.fdopen(fd, 'w', encoding='UTF-8') as file_handle:
+            json.dump(cache, file_handle)
+        os.replace(tmp_path, cache_path)
+    except OSError as exception:
+        logger.debug('Cannot save calibration: %s', exception)
+    return factor
+
+
+def load_factor(cap=MAX_LOAD_FACTOR):
+    """How oversubscribed the host is right now: the one minute load
+    average per CPU, never less than 1 nor more than cap."""
+    try:
+        load = os.getloadavg()[0]
+    except OSError:
+        return 1.0
+    return min(cap, max(1.0, load / (os.cpu_count() or 1)))
+
+
+def timing_factor():
+    """The factor that scales a job's timeouts: the host's calibration
+    times its current load. Sample it once per job, before the job's own
+    builds and unit tests add to the load."""
+    return host_factor() * load_factor()
+
+
+def effective_timeout(
+    base,
+    reference_runtime=None,
+    multiplier=10,
+    factor=1.0,
+    max_timeout=30,
+):
+    """The timeout for one run: the base timeout, or multiplier times the
+    reference solution's runtime when that is longer, scaled by factor (see
+    host_factor() and load_factor()) and capped at max_timeout."""
+    timeout = base
+    if reference_runtime:
+        timeout = max(timeout, multiplier * reference_runtime)
+    return min(timeout * factor, max_timeout)
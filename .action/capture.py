@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Capture the output of the programs the grader runs without holding
+    all of it in memory. Only the first and last part of a stream are
+    kept up to a byte cap, with a marker in place of what was dropped,
+    so a program stuck in a print loop cannot grow the grader. """
+
+import os
+import selectors
+import subprocess
+import threading
+import time
+from accounting import wait_accounted
+from sandbox import kill_process_group
+from tracing import command_label, span
+
+# Bytes kept of each stream: the first half and the last half
+DEFAULT_MAX_BYTES = 1024 * 1024
+# Bytes a line of a stream read line by line may grow to
+DEFAULT_MAX_LINE_BYTES = 64 * 1024
+
+
+def new_capture(max_bytes):
+    """A capture keeps a head of max_bytes // 2 bytes and a tail with the
+    rest; max_bytes of None keeps everything."""
+    return {
+        'head': bytearray(),
+        'tail': bytearray(),
+        'dropped': 0,
+        'max_bytes': max_bytes,
+    }
+
+
+def append_capture(capture, chunk):
+    """Add a chunk to the capture, dropping bytes from the middle."""
+    max_bytes = capture['max_bytes']
+    if max_bytes is None:
+        capture['head'] += chunk
+        return
+    head_room = max_bytes // 2 - len(capture['head'])
+    if head_room > 0:
+        capture['head'] += chunk[:head_room]
+        chunk = chunk[head_room:]
+    capture['tail'] += chunk
+    excess = len(capture['tail']) - (max_bytes - max_bytes // 2)
+    if excess > 0:
+        del capture['tail'][:excess]
+        capture['dropped'] += excess
+
+
+def capture_result(capture):
+    """Return a tuple of the captured bytes and whether any were dropped."""
+    if not capture['dropped']:
+        return (bytes(capture['head'] + capture['tail']), False)
+    marker = f"\n... [{capture['dropped']} bytes truncated] ...\n".encode('UTF-8')
+    return (bytes(capture['head'] + marker + capture['tail']), True)
+
+
+def capture_streams(streams, deadline=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Read the pipes streams side by side until all of them are closed
+    or the deadline, a time.monotonic() value, passes. Returns a tuple of
+    a list with a tuple of the bytes kept and whether any were dropped for
+    each stream, and whether all streams were closed."""
+    captures = {stream: new_capture(max_bytes) for stream in streams}
+    selector = selectors.DefaultSelector()
+    for stream in streams:
+        selector.register(stream, selectors.EVENT_READ)
+    closed = True
+    try:
+        while selector.get_map():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    closed = False
+                    break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fileobj.fileno(), 65536)
+                if chunk:
+                    append_capture(captures[key.fileobj], chunk)
+                else:
+                    selector.unregister(key.fileobj)
+    finally:
+        selector.close()
+    return ([capture_result(captures[stream]) for stream in streams], closed)
+
+
+def read_lines(stream, deadline, max_line_bytes=DEFAULT_MAX_LINE_BYTES):
+    """Yield the lines written to a pipe as they arrive until the pipe is
+    closed or the deadline, a time.monotonic() value, passes. deadline may
+    also be a function returning the deadline, which lets the caller move
+    it while reading. A line longer than max_line_bytes is cut and the
+    rest of it dropped."""
+    if not callable(deadline):
+        fixed_deadline = deadline
+
+        def deadline():
+            return fixed_deadline
+
+    selector = selectors.DefaultSelector()
+    selector.register(stream, selectors.EVENT_READ)
+    buffer = b''
+    skipping = False
+    try:
+        while True:
+            remaining = deadline() - time.monotonic()
+            if remaining <= 0:
+                return
+            if not selector.select(remaining):
+                continue
+            chunk = os.read(stream.fileno(), 65536)
+            if not chunk:
+                break
+            *lines, buffer = (buffer + chunk).split(b'\n')
+            for line in lines:
+                if not skipping:
+                    yield line.decode('UTF-8', errors='replace')
+                skipping = False
+            if len(buffer) > max_line_bytes:
+                if not skipping:
+                    yield buffer[:max_line_bytes].decode('UTF-8', errors='replace')
+                buffer = b''
+                skipping = True
+        if buffer and not skipping:
+            yield buffer.decode('UTF-8', errors='replace')
+    finally:
+        selector.close()
+
+
+def _write_input(stream, data):
+    """Write data to a program's standard input and close it. The program
+    may exit without reading it all."""
+    try:
+        stream.write(data)
+        stream.close()
+    except (BrokenPipeError, OSError):
+        pass
+
+
+def start_input(proc, data):
+    """Write data, bytes, to proc's standard input from a thread so that
+    it cannot block reading the program's output. Returns the thread, or
+    None when there is no input."""
+    if data is None:
+        return None
+    writer = threading.Thread(target=_write_input, args=(proc.stdin, data))
+    writer.start()
+    return writer
+
+
+def run_captured(args, *popen_args, **keywords):
+    """Like subprocess.run() with capture_output=True, except that only
+    max_bytes of stdout and of stderr are kept, see capture_streams(). The
+    program runs in its own process group, which is killed on timeout
+    before subprocess.TimeoutExpired is raised. Returns a
+    subprocess.CompletedProcess with the extra attributes truncated, True
+    when output was dropped, and usage, the wall time, CPU time, and peak
+    memory of the program. Each run is a span in the trace."""
+    with span(command_label(args), 'subprocess'):
+        return _run_captured(args, *popen_args, **keywords)
+
+
+def _run_captured(
+    args,
+    input=None,  # pylint: disable=redefined-builtin
+    timeout=None,
+    max_bytes=DEFAULT_MAX_BYTES,
+    text=True,
+    **popen_args,
+):
+    """Run args and capture its output, see run_captured()."""
+    if text and input is not None:
+        input = input.encode('UTF-8')
+    start = time.monotonic()
+    deadline = start + timeout if timeout else None
+    # pylint: disable-next=consider-using-with
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        **popen_args,
+    )
+    writer = start_input(proc, input)
+    try:
+        captured, closed = capture_streams(
+            [proc.stdout, proc.stderr], deadline, max_bytes
+        )
+        (stdout, stdout_truncated), (stderr, stderr_truncated) = captured
+        if not closed:
+            kill_process_group(proc.pid)
+        timed_out, usage = wait_accounted(proc, start, deadline if closed else None)
+        if timed_out or not closed:
+            raise subprocess.TimeoutExpired(args, timeout, output=stdout, stderr=stderr)
+    finally:
+        if writer:
+            writer.join()
+        proc.stdout.close()
+        proc.stderr.close()
+    if text:
+        stdout = stdout.decode('UTF-8', errors='replace')
+        stderr = stderr.decode('UTF-8', errors='replace')
+    completed = subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+    completed.truncated = stdout_truncated or stderr_truncated
+    completed.usage = usage
+    return completed
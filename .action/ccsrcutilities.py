@@ -30,13 +30,16 @@
 import datetime
 import glob
 import json
-import subprocess
+import tempfile
 import difflib
 import os
 import os.path
 import platform
+import shlex
 import sys
+from execute import execute
 from logger import setup_logger
+from tracing import span
 
 import lab_config as cfg
 
@@ -58,6 +61,40 @@ def backup_file(target_file_path):
         sys.exit(1)
 
 
+def build_profile_block(part_cfg, default_profile='student'):
+    """Return the Makefile fragment that selects CXXFLAGS and LDFLAGS
+    from the part's build profiles using the BUILD_PROFILE variable."""
+    profiles = part_cfg.get(
+        'build_profiles',
+        {
+            default_profile: {
+                'CXXFLAGS': part_cfg['CXXFLAGS'],
+                'LDFLAGS': part_cfg['LDFLAGS'],
+            }
+        },
+    )
+    lines = [f'BUILD_PROFILE ?= {default_profile}']
+    keyword = 'ifeq'
+    for name, flags in profiles.items():
+        if name == default_profile:
+            continue
+        lines.append(f'{keyword} ($(BUILD_PROFILE),{name})')
+        lines.append(f"\tCXXFLAGS += {flags['CXXFLAGS']}")
+        lines.append(f"\tLDFLAGS += {flags['LDFLAGS']}")
+        keyword = 'else ifeq'
+    default_flags = profiles[default_profile]
+    if keyword == 'ifeq':
+        # Only the default profile exists
+        lines.append(f"CXXFLAGS += {default_flags['CXXFLAGS']}")
+        lines.append(f"LDFLAGS += {default_flags['LDFLAGS']}")
+    else:
+        lines.append('else')
+        lines.append(f"\tCXXFLAGS += {default_flags['CXXFLAGS']}")
+        lines.append(f"\tLDFLAGS += {default_flags['LDFLAGS']}")
+        lines.append('endif')
+    return '\n'.join(lines)
+
+
 def mk_makefiles(repo_root, config=cfg, makefile_name='Makefile'):
     """Given a configuration dict and a repository root
     (relative or fully qualified path), generate all makefiles"""
@@ -83,8 +120,11 @@ HEADERS = {part_cfg['header']} {part_cfg['other_header']}
 DO_UNITTESTS = "{str(part_cfg['do_unit_tests'])}"
 
 CXX = {part_cfg['CXX']}
-CXXFLAGS += {part_cfg['CXXFLAGS']}
-LDFLAGS += {part_cfg['LDFLAGS']}
+{build_profile_block(part_cfg)}
+# Set TIME_TRACE=1 to have clang write a per-file compile time trace
+ifeq ($(TIME_TRACE),1)
+	CXXFLAGS += -ftime-trace
+endif
 
 UNAME_S = $(shell uname -s)
 ifeq ($(UNAME_S),Linux)
@@ -168,6 +208,9 @@ doc: $(CXXFILES) $(HEADERS)
 compilecmd:
 	@echo "$(CXX) $(CXXFLAGS)"
 
+syntaxcheck:
+	$(CXX) $(CXXFLAGS) -fsyntax-only $(CXXFILES)
+
 format:
 	@python3 ../.action/checks.py format $(LAB_PART)
 
@@ -177,19 +220,25 @@ lint:
 header:
 	@python3 ../.action/checks.py header $(LAB_PART)
 
+buildtimes:
+	@python3 ../.action/checks.py buildtimes $(LAB_PART)
+
 test:
 	@python3 ../.action/solution_check.py $(LAB_PART) $(TARGET)
 
 ifneq ($(DO_UNITTESTS), "True")
-unittest:
+unittest unittestbin:
 	@echo "No unit tests for $(LAB_PART)"
 else
 unittest: cleanunittest utest
 
-utest: {part_cfg['gtest_dependencies']}
-	{part_cfg['gtest_compile_cmd']}
+utest: unittestbin
 	{part_cfg['gtest_run']}
 
+# Build the unit test program without running it
+unittestbin: {part_cfg['gtest_dependencies']}
+	{part_cfg['gtest_compile_cmd']}
+
 endif
 
 cleanunittest:
@@ -212,7 +261,7 @@ cleanunittest:
     top_level_makefile = f"""
 # Automatically generated by {__file__} on {now}
 
-TOPTARGETS = all clean spotless format lint header test unittest
+TOPTARGETS = all clean spotless format lint header buildtimes test unittest
 
 SUBDIRS = $(wildcard part-?/.)
 
@@ -252,11 +301,12 @@ USE_MDFILE_AS_MAINPAGE = README.md
 
 
 def create_clang_compile_commands_db(
-    files=None, remove_existing_db=False, compile_cmd=None
+    files=None, remove_existing_db=False, compile_cmd=None, out_dir='.'
 ):
     """Create a Clang compile commands DB named
-    compile_commands.json in the current working directory."""
-    out = 'compile_commands.json'
+    compile_commands.json in out_dir, the current working directory by
+    default."""
+    out = os.path.join(out_dir, 'compile_commands.json')
     linux_includes = ' -I/usr/include/c++/9/'
     darwin_includes = ' -D OSX -nostdinc++ -I/opt/local/include/libcxx/v1'
     my_platform = platform.system()
@@ -299,7 +349,6 @@ def remove_cpp_comments(file):
     # https://stackoverflow.com/questions/35700193/how-to-find-a-search-term-in-source-code/35708616#35708616
     logger = setup_logger()
     no_comments = None
-    cmd = 'clang++ -E -P -'
     try:
         with open(file, encoding='UTF-8') as file_handle:
             # replace 'a', '__' and '#' to avoid preprocessor handling
@@ -309,15 +358,7 @@ def remove_cpp_comments(file):
                 .replace('__', 'aB')
                 .replace('#', 'aC')
             )
-        proc = subprocess.run(
-            [cmd],
-            capture_output=True,
-            shell=True,
-            timeout=10,
-            check=False,
-            text=True,
-            input=filtered_contents,
-        )
+        proc = execute(['clang++', '-E', '-P', '-'], input=filtered_contents)
         if proc.returncode == 0:
             no_comments = (
                 proc.stdout.replace('aC', '#')
@@ -360,15 +401,7 @@ def makefile_get_compilecmd(target_dir, compiler='clang++'):
     matches = None
     for makefile in makefiles:
         if makefile_has_compilecmd(makefile):
-            cmd = 'make -C {} compilecmd'.format(target_dir)
-            proc = subprocess.run(
-                [cmd],
-                capture_output=True,
-                shell=True,
-                timeout=10,
-                check=False,
-                text=True,
-            )
+            proc = execute(['make', '-C', target_dir, 'compilecmd'], timeout=10)
             matches = [
                 line
                 for line in str(proc.stdout).split('\n')
@@ -412,18 +445,7 @@ def format_check(file):
     Throws ChildProcessError if clang-format is not executable."""
     # logger = setup_logger()
     # clang-format
-    cmd = 'clang-format'
-    cmd_options = '-style=Google --Werror'
-    cmd = cmd + ' ' + cmd_options + ' ' + file
-    # logger.debug('clang format: %s', cmd)
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=10,
-        check=False,
-        text=True,
-    )
+    proc = execute(['clang-format', '-style=Google', '--Werror', file])
     if proc.returncode != 0:
         raise ChildProcessError('clang-format is not executable')
     correct_format = str(proc.stdout).split('\n')
@@ -440,29 +462,40 @@ def format_check(file):
     return list(diff)
 
 
-def lint_check(file, tidy_options=None, skip_compile_cmd=False):
+def lint_check(file, tidy_options=None, skip_compile_cmd=False, build_dir=None):
     """ Use clang-tidy to lint the file. Options for clang-tidy \
-    defined in the function. """
+    defined in the function. The compile commands DB is written to \
+    build_dir; without one, a temporary directory is used so that \
+    nothing is written to the current working directory. """
+    if not build_dir:
+        with tempfile.TemporaryDirectory(prefix='lint-') as tmp_dir:
+            return lint_check(file, tidy_options, skip_compile_cmd, tmp_dir)
     logger = setup_logger()
     # clang-tidy
     if not skip_compile_cmd:
-        logger.debug(
-            'Checking for makefile in %s',
-            os.path.dirname(os.path.realpath(file)),
-        )
-        compilecmd = makefile_get_compilecmd(
-            os.path.dirname(os.path.realpath(file))
-        )
+        # Prefer the Makefile in the build directory; running make in the
+        # source directory regenerates dependency files there.
+        makefile_dir = build_dir
+        if not glob.glob(os.path.join(build_dir, '*Makefile')):
+            makefile_dir = os.path.dirname(os.path.realpath(file))
+        logger.debug('Checking for makefile in %s', makefile_dir)
+        with span('compile command', file=os.path.basename(file)):
+            compilecmd = makefile_get_compilecmd(makefile_dir)
         logger.debug('Makefile reported compile commmand as %s', compilecmd)
     if not skip_compile_cmd and compilecmd:
         logger.debug('Using compile command %s', compilecmd)
         create_clang_compile_commands_db(
-            remove_existing_db=True, compile_cmd=compilecmd
+            files=[file],
+            remove_existing_db=True,
+            compile_cmd=compilecmd,
+            out_dir=build_dir,
         )
         logger.debug('Created clang compile command db.')
     elif not skip_compile_cmd and not compilecmd:
         logger.debug('Creating compile commands.')
-        create_clang_compile_commands_db(files=[file], remove_existing_db=True)
+        create_clang_compile_commands_db(
+            files=[file], remove_existing_db=True, out_dir=build_dir
+        )
     cmd = 'clang-tidy'
     if not tidy_options:
         logger.debug('Using default tidy options.')
@@ -478,18 +511,14 @@ def lint_check(file, tidy_options=None, skip_compile_cmd=False):
         # cmd_options = '-checks="*"'
     else:
         cmd_options = tidy_options
-    cmd = cmd + ' ' + cmd_options + ' ' + file
+    # The options are written as for a shell; a backslash at the end of a
+    # line continues it.
+    argv = [cmd] + shlex.split(cmd_options.replace('\\\n', '')) + [file]
+    if not skip_compile_cmd:
+        argv += ['-p', build_dir]
     if skip_compile_cmd:
-        cmd = cmd + ' -- -std=c++17'
-    logger.debug('Tidy command %s', cmd)
-    proc = subprocess.run(
-        [cmd],
-        capture_output=True,
-        shell=True,
-        timeout=60,
-        check=False,
-        text=True,
-    )
+        argv += ['--', '-std=c++17']
+    proc = execute(argv)
     linter_warnings = str(proc.stdout).split('\n')
     linter_warnings = [line for line in linter_warnings if line != '']
     return linter_warnings
@@ -220,6 +220,23 @@ def run_lint_check(files):
 #     sys.exit(status)
 
 
+def run_build_profile_report(part_dirs):
+    """Build each part with every build profile and report the time each
+    profile saves compared to the student profile."""
+    # Imported here; assessment imports this module.
+    # pylint: disable-next=import-outside-toplevel
+    from assessment import compare_build_profiles
+
+    logger = setup_logger()
+    status = 0
+    for part_dir in part_dirs:
+        logger.info('Timing build profiles for %s', part_dir)
+        build_times = compare_build_profiles(part_dir)
+        if None in build_times.values():
+            status = 1
+    sys.exit(status)
+
+
 def main():
     """Main function; looks at sys.argv and calls the appropriate function."""
     logger = setup_logger()
@@ -255,7 +272,19 @@ def main():
         lab_config = cfg.lab['parts'][part_num - 1]
         files = lab_config['src'].split() + lab_config['header'].split()
     status = 1
-    if cmd == 'format':
+    if cmd == 'buildtimes':
+        # Build times are measured per part directory, not per file.
+        if sys.argv[2] == 'all':
+            part_dirs = [
+                f'part-{index + 1}' for index in range(cfg.lab['num_parts'])
+            ]
+        elif os.path.isdir(sys.argv[2]):
+            part_dirs = [sys.argv[2]]
+        else:
+            # Started by make from within the part's directory
+            part_dirs = ['.']
+        run_build_profile_report(part_dirs)
+    elif cmd == 'format':
         run_format_check(files)
     elif cmd == 'lint':
         run_lint_check(files)
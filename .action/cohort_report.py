@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Summarize a cohort's gradelogs after a deadline: how many
+    submissions pass each stage, how late they are, and the most common
+    failure notes. Rows are streamed through reducers that keep a fixed
+    amount of state, so tens of thousands of rows take seconds.
+
+    ex.
+    .action/cohort_report.py path/to/clones/*/.*_gradelog.csv
+    .action/cohort_report.py grades.sqlite
+    .action/cohort_report.py --group Author grades.sqlite
+"""
+
+import csv
+import re
+import sys
+from gradelog import latest_runs
+from logger import setup_logger
+
+# Gradelog columns holding 1/0 or n/m results, in pipeline order
+STAGES = ['Header', 'Formatting', 'Linting', 'Build', 'Tests', 'UnitTests']
+# DaysLate histogram buckets; the last one collects everything later
+LATE_BUCKETS = [0, 1, 2, 3, 7]
+# Number of failure notes reported
+TOP_NOTES = 10
+
+
+def read_rows(paths):
+    """Yield the gradelog rows of CSV files and gradelog databases, one at
+    a time. A database contributes the latest run of every repository and
+    part."""
+    for path in paths:
+        if path.endswith(('.sqlite', '.db')):
+            yield from latest_runs(path)
+            continue
+        with open(path, 'r', encoding='UTF-8', newline='') as csv_handle:
+            yield from csv.DictReader(csv_handle)
+
+
+def parse_fraction(value):
+    """Return a stage's result as (passed, total): '2/3' is (2, 3) and
+    '1' is (1, 1). Results that are empty or not numbers, such as
+    'Skipped', are None."""
+    value = str(value or '').strip()
+    match = re.fullmatch(r'(\d+)\s*/\s*(\d+)', value)
+    if match:
+        return (int(match.group(1)), int(match.group(2)))
+    if re.fullmatch(r'\d+', value):
+        return (min(int(value), 1), 1)
+    return None
+
+
+def normalize_note(note):
+    """Reduce a note to what submissions have in common: numbers, file
+    names, and partial counts vary from one submission to the next."""
+    note = re.sub(r'[\w./-]+\.(cc|h|cpp)\b', '<file>', note)
+    note = re.sub(r'\d+', '#', note)
+    return note.strip()[:120]
+
+
+def new_top_counter(capacity):
+    """A space-saving counter of the most frequent items that keeps at
+    most capacity items; the counts of frequent items are exact up to
+    the error of the item each one replaced."""
+    return {'capacity': capacity, 'counts': {}, 'errors': {}}
+
+
+def count_item(counter, item):
+    """Count one occurrence of item."""
+    counts = counter['counts']
+    if item in counts:
+        counts[item] += 1
+    elif len(counts) < counter['capacity']:
+        counts[item] = 1
+        counter['errors'][item] = 0
+    else:
+        # Replace the least frequent item and inherit its count.
+        smallest = min(counts, key=counts.get)
+        floor = counts.pop(smallest)
+        del counter['errors'][smallest]
+        counts[item] = floor + 1
+        counter['errors'][item] = floor
+
+
+def top_items(counter, count):
+    """Return the count most frequent items as (item, count) tuples."""
+    return sorted(counter['counts'].items(), key=lambda item: -item[1])[:count]
+
+
+def new_summary():
+    """The reducer state of one group of rows."""
+    return {
+        'rows': 0,
+        'stages': {
+            stage: {'graded': 0, 'passed': 0, 'points': 0, 'total': 0}
+            for stage in STAGES
+        },
+        'late': [0] * (len(LATE_BUCKETS) + 1),
+        'notes': new_top_counter(TOP_NOTES * 20),
+    }
+
+
+def add_row(summary, row):
+    """Fold one gradelog row into a summary."""
+    summary['rows'] += 1
+    for stage in STAGES:
+        result = parse_fraction(row.get(stage))
+        if result is None:
+            continue
+        passed, total = result
+        stats = summary['stages'][stage]
+        stats['graded'] += 1
+        stats['passed'] += total > 0 and passed == total
+        stats['points'] += passed
+        stats['total'] += total
+    try:
+        days_late = int(row.get('DaysLate') or 0)
+    except ValueError:
+        days_late = 0
+    bucket = len(LATE_BUCKETS)
+    for index, limit in enumerate(LATE_BUCKETS):
+        if days_late <= limit:
+            bucket = index
+            break
+    summary['late'][bucket] += 1
+    # Only failures are counted; informational lines such as "Unit tests
+    # disabled." and the continuation lines of a failure are not.
+    for column in ('Notes', 'UnitTestNotes'):
+        for note in (row.get(column) or '').splitlines():
+            if note.startswith('❌'):
+                count_item(summary['notes'], normalize_note(note))
+
+
+def summarize(rows, group_by=None):
+    """Reduce rows to a summary per value of the column group_by, or one
+    summary under 'All'. Returns a dictionary of group to summary."""
+    summaries = {}
+    for row in rows:
+        group = row.get(group_by, '') if group_by else 'All'
+        if group not in summaries:
+            summaries[group] = new_summary()
+        add_row(summaries[group], row)
+    return summaries
+
+
+def late_labels():
+    """Labels of the DaysLate histogram buckets."""
+    labels = []
+    previous = None
+    for limit in LATE_BUCKETS:
+        if previous is None:
+            labels.append('on time' if limit == 0 else f'<= {limit}')
+        elif limit == previous + 1:
+            labels.append(f'{limit}')
+        else:
+            labels.append(f'{previous + 1}-{limit}')
+        previous = limit
+    labels.append(f'> {LATE_BUCKETS[-1]}')
+    return labels
+
+
+def format_summary(group, summary):
+    """Return the report of one group as a list of lines."""
+    lines = [f"== {group}: {summary['rows']} submissions"]
+    lines.append(f"{'Stage':12} {'Graded':>7} {'Passed':>7} {'Rate':>7} {'Points':>9}")
+    for stage, stats in summary['stages'].items():
+        if not stats['graded']:
+            continue
+        rate = 100 * stats['passed'] / stats['graded']
+        points = f"{stats['points']}/{stats['total']}"
+        lines.append(
+            f"{stage:12} {stats['graded']:>7} {stats['passed']:>7} "
+            f'{rate:>6.1f}% {points:>9}'
+        )
+    lines.append('DaysLate')
+    for label, count in zip(late_labels(), summary['late']):
+        lines.append(f'  {label:10} {count:>7}')
+    lines.append('Most common failures')
+    for note, count in top_items(summary['notes'], TOP_NOTES):
+        lines.append(f'  {count:>7}  {note}')
+    return lines
+
+
+def main():
+    """Print the cohort report of the gradelogs given on the command
+    line, optionally grouped by a column with --group COLUMN."""
+    logger = setup_logger()
+    args = sys.argv[1:]
+    group_by = None
+    if len(args) >= 2 and args[0] == '--group':
+        group_by = args[1]
+        args = args[2:]
+    if not args:
+        logger.error('Provide gradelog CSV files or a gradelog database.')
+        sys.exit(1)
+    summaries = summarize(read_rows(args), group_by)
+    for group in sorted(summaries):
+        print('\n'.join(format_summary(group, summaries[group])))
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+""" Differential testing of a student's program against a reference.
+    The program is run over every valid input and a batch of random
+    invalid inputs, and each result is compared with the reference's.
+    A mismatch is reduced to the smallest input that still mismatches.
+
+    ex.
+    .action/differential.py part-2 part-2/blackjack
+"""
+
+import random
+import re
+import sys
+from calibration import effective_timeout, timing_factor
+from logger import setup_logger
+from program_runner import run_programs
+
+import lab_config as cfg
+
+
+def blackjack_reference(args):
+    """The result the blackjack program must produce for args."""
+    if len(args) != 2:
+        return {
+            'output': 'error: you must supply two arguments\n',
+            'returncode': 1,
+            'timed_out': False,
+        }
+    if not all(arg in cfg.card_names for arg in args):
+        return {
+            'output': 'error: invalid card name\n',
+            'returncode': 1,
+            'timed_out': False,
+        }
+    return {
+        'output': f'{cfg.blackjack_score(*args)}\n',
+        'returncode': 0,
+        'timed_out': False,
+    }
+
+
+def blackjack_valid_inputs():
+    """Every two card hand."""
+    return [
+        [card_1, card_2] for card_1 in cfg.card_names for card_2 in cfg.card_names
+    ]
+
+
+def blackjack_invalid_inputs(count, seed=0):
+    """count random inputs that are not a valid pair of card names: the
+    wrong number of cards, or a name that is close to a card name."""
+    generator = random.Random(seed)
+    near_misses = ['', ' ', 'a', 'k', '1', '0', '11', '01', 'AA', '10 ', ' A', 'X', 'Ace']
+
+    def random_name():
+        if generator.random() < 0.5:
+            return generator.choice(near_misses)
+        length = generator.randint(1, 4)
+        return ''.join(generator.choice('AJQK0123456789xyz') for _ in range(length))
+
+    inputs = []
+    while len(inputs) < count:
+        if generator.random() < 0.3:
+            size = generator.choice([0, 1, 3, 4])
+            args = [generator.choice(cfg.card_names) for _ in range(size)]
+        else:
+            args = [generator.choice(cfg.card_names), generator.choice(cfg.card_names)]
+            args[generator.randrange(2)] = random_name()
+        if blackjack_reference(args)['returncode'] != 0:
+            inputs.append(args)
+    return inputs
+
+
+# Reference implementations and input generators by part target name
+references = {
+    'blackjack': {
+        'reference': blackjack_reference,
+        'valid_inputs': blackjack_valid_inputs,
+        'invalid_inputs': blackjack_invalid_inputs,
+    },
+}
+
+
+def normalize_result(result):
+    """Reduce a result to what must match: whether the program finished,
+    whether it succeeded, and either the first number it printed or
+    whether it printed an error message."""
+    if result['timed_out']:
+        return ('timed out',)
+    if result['returncode'] != 0:
+        return ('error', 'error:' in result['output'].lower())
+    match = re.search(r'\d+', result['output'])
+    return ('ok', int(match.group(0)) if match else None)
+
+
+def find_mismatches(
+    binary,
+    inputs,
+    reference,
+    normalize=normalize_result,
+    batch_size=64,
+    time_out=1,
+    factor=1.0,
+    limits=None,
+):
+    """Run binary on every input in batches of parallel runs and return a
+    list of (args, expected, actual) for the inputs where the normalized
+    results differ from the reference. Each run's timeout and sandbox
+    limits are set as solution_check.run_tests() sets a test case's: from
+    time_out, the reference's runtime when it has one, and factor."""
+    mismatches = []
+    for start in range(0, len(inputs), batch_size):
+        batch = inputs[start:start + batch_size]
+        expected_results = [reference(args) for args in batch]
+        cases = [
+            {
+                'args': args,
+                'timeout': effective_timeout(
+                    time_out,
+                    None if expected.get('timed_out') else expected.get('duration'),
+                    factor=factor,
+                ),
+            }
+            for args, expected in zip(batch, expected_results)
+        ]
+        results = run_programs(binary, cases, limits=limits)
+        for args, reference_result, result in zip(batch, expected_results, results):
+            expected = normalize(reference_result)
+            actual = normalize(result)
+            if expected != actual:
+                mismatches.append((args, expected, actual))
+    return mismatches
+
+
+def shrink_input(
+    binary, args, reference, normalize=normalize_result, max_runs=100, **run_options
+):
+    """Greedily remove arguments and characters from a mismatching input
+    while it still mismatches. Returns the smallest input found.
+    run_options are passed on to find_mismatches()."""
+
+    def mismatches(candidate):
+        return bool(
+            find_mismatches(binary, [candidate], reference, normalize, **run_options)
+        )
+
+    runs = 0
+    shrunk = True
+    while shrunk and runs < max_runs:
+        shrunk = False
+        candidates = [args[:index] + args[index + 1:] for index in range(len(args))]
+        candidates += [
+            args[:index] + [arg[:position] + arg[position + 1:]] + args[index + 1:]
+            for index, arg in enumerate(args)
+            for position in range(len(arg))
+        ]
+        for candidate in candidates:
+            if runs >= max_runs:
+                break
+            runs += 1
+            if mismatches(candidate):
+                args = candidate
+                shrunk = True
+                break
+    return args
+
+
+def differential_test(
+    binary,
+    target,
+    random_inputs=200,
+    seed=0,
+    max_report=5,
+    reference=None,
+    time_out=1,
+    factor=1.0,
+    limits=None,
+):
+    """Compare binary with the reference for target over every valid input
+    and random_inputs random invalid inputs. Returns True when every
+    result matches, and logs the smallest mismatching input otherwise.
+    reference replaces the built-in reference implementation, e.g. with
+    the cached results of an instructor's program. The program runs with
+    the base timeout time_out scaled by factor and the sandbox limits
+    limits, see find_mismatches()."""
+    run_options = {'time_out': time_out, 'factor': factor, 'limits': limits}
+    logger = setup_logger()
+    spec = references[target]
+    if not reference:
+        reference = spec['reference']
+    inputs = spec['valid_inputs']() + spec['invalid_inputs'](random_inputs, seed)
+    mismatches = find_mismatches(binary, inputs, reference, **run_options)
+    logger.info(
+        'Differential test: %d/%d inputs match the reference',
+        len(inputs) - len(mismatches),
+        len(inputs),
+    )
+    if not mismatches:
+        return True
+    for args, expected, actual in mismatches[:max_report]:
+        logger.error('Input %s: expected %s, got %s', args, expected, actual)
+    smallest = min(mismatches, key=lambda item: (len(item[0]), sum(map(len, item[0]))))
+    smallest_args = shrink_input(binary, smallest[0], reference, **run_options)
+    shrunk = find_mismatches(binary, [smallest_args], reference, **run_options)
+    if shrunk:
+        smallest = shrunk[0]
+    logger.error('Smallest failing input: %s expected %s, got %s', *smallest)
+    return False
+
+
+def main():
+    """Run a differential test of a part's program from the command line."""
+    logger = setup_logger()
+    if len(sys.argv) < 3:
+        logger.error('Provide the part, e.g. part-2, and the path to the program.')
+        sys.exit(1)
+    part_config = cfg.lab['parts'][int(sys.argv[1].split('-')[-1]) - 1]
+    settings = part_config.get('differential') or {}
+    passed = differential_test(
+        sys.argv[2],
+        settings.get('target', part_config['target']),
+        settings.get('random_inputs', 200),
+        settings.get('seed', 0),
+        factor=timing_factor(),
+        limits=part_config['sandbox_limits'],
+    )
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
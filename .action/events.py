@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Record what each grading stage found as structured events, one JSON
+    object per line appended to an event log, instead of only as text.
+    The gradelog's Notes and UnitTestNotes are rendered from the events. """
+
+import json
+import os
+from datetime import datetime, timezone
+
+# Statuses of an event: 'pass' is not shown in the notes, 'fail' is shown
+# with a cross, and 'info' and 'warn' are shown as they are.
+STATUSES = ('pass', 'fail', 'warn', 'info')
+# Events of these stages are rendered in UnitTestNotes instead of Notes
+UNITTEST_STAGES = ('unittest',)
+
+
+def default_event_log(repo_root, repo_name, part_name):
+    """The event log lives next to the part's gradelog CSV."""
+    return os.path.join(repo_root, f'.{repo_name}_{part_name}_events.jsonl')
+
+
+def new_event_log(repo, part, path=None):
+    """Start collecting the events of grading one part. With a path, each
+    event is also appended to that file as it happens."""
+    return {'repo': repo, 'part': part, 'path': path, 'events': []}
+
+
+def emit(event_log, stage, status, detail='', file=None, duration=None, **data):
+    """Record that stage finished with status for file, or the whole part
+    when file is None, taking duration seconds. detail is the text shown
+    in the notes; any other keyword arguments are kept as the event's
+    data."""
+    if status not in STATUSES:
+        raise ValueError(f'Unknown event status {status}')
+    event = {
+        'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'repo': event_log['repo'],
+        'part': event_log['part'],
+        'stage': stage,
+        'file': os.path.basename(file) if file else None,
+        'status': status,
+        'duration': round(duration, 4) if duration is not None else None,
+        'detail': detail,
+    }
+    if data:
+        event['data'] = data
+    event_log['events'].append(event)
+    if event_log['path']:
+        # One write per line to a file opened for appending keeps the
+        # lines of concurrent graders whole.
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with open(event_log['path'], 'a', encoding='UTF-8') as log_handle:
+            log_handle.write(line)
+    return event
+
+
+def render_notes(events, unittest=False):
+    """Render events as the text of the Notes column, or of the
+    UnitTestNotes column with unittest, one line per event."""
+    lines = []
+    for event in events:
+        if (event['stage'] in UNITTEST_STAGES) != unittest:
+            continue
+        if event['status'] == 'pass' or not event['detail']:
+            continue
+        prefix = '❌ ' if event['status'] == 'fail' else ''
+        lines.append(f"{prefix}{event['detail']}\n")
+    return ''.join(lines)
+
+
+def read_events(paths):
+    """Yield the events in event log files one at a time."""
+    for path in paths:
+        with open(path, 'r', encoding='UTF-8') as log_handle:
+            for line in log_handle:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Run the external tools the grader needs, such as git, make,
+    clang-format, and clang-tidy, from argument lists without a shell,
+    each with its own timeout, and keep account of every process started
+    so the cost of grading a submission is visible. """
+
+import os
+import subprocess
+import threading
+from capture import run_captured
+from logger import setup_logger
+from replay import created_files, exec_mode, list_files, record, replayed, tape_key
+from sandbox import launched_program
+
+import lab_config as cfg
+
+# Seconds each tool may run unless the caller gives a timeout
+DEFAULT_TOOL_TIMEOUTS = {
+    'git': 15,
+    'make': 120,
+    'clang++': 10,
+    'clang-format': 10,
+    'clang-tidy': 60,
+}
+# Seconds any other program may run
+DEFAULT_TIMEOUT = 60
+
+_EXECUTIONS = []
+_LOCK = threading.Lock()
+
+
+def tool_name(argv):
+    """The name of the program argv runs, e.g. 'make', also when it runs
+    under the sandbox's launcher."""
+    return os.path.basename(str(launched_program(argv)[0]))
+
+
+def tool_timeout(tool, timeouts=None):
+    """The timeout of a tool from timeouts, lab['tool_timeouts'],
+    DEFAULT_TOOL_TIMEOUTS, or DEFAULT_TIMEOUT, in that order."""
+    for table in (timeouts, cfg.lab.get('tool_timeouts'), DEFAULT_TOOL_TIMEOUTS):
+        if table and tool in table:
+            return table[tool]
+    return DEFAULT_TIMEOUT
+
+
+def record_execution(tool, returncode, usage=None, timed_out=False):
+    """Account for one process the grader started. Programs started
+    without execute(), such as student programs, are recorded here too."""
+    usage = usage or {}
+    with _LOCK:
+        _EXECUTIONS.append(
+            {
+                'tool': tool,
+                'returncode': returncode,
+                'timed_out': timed_out,
+                'wall_time': usage.get('wall_time'),
+                'cpu_time': usage.get('cpu_time'),
+                'peak_rss_kb': usage.get('peak_rss_kb'),
+            }
+        )
+
+
+def executions():
+    """Return the records of every process started so far."""
+    with _LOCK:
+        return list(_EXECUTIONS)
+
+
+def reset_executions():
+    """Forget the processes started so far."""
+    with _LOCK:
+        _EXECUTIONS.clear()
+
+
+def execution_summary(records=None):
+    """Summarize the processes started per tool: how many, how many
+    failed or timed out, and their total wall and CPU time."""
+    summary = {}
+    for record in executions() if records is None else records:
+        tool = summary.setdefault(
+            record['tool'],
+            {
+                'count': 0,
+                'failed': 0,
+                'timed_out': 0,
+                'wall_time': 0.0,
+                'cpu_time': 0.0,
+            },
+        )
+        tool['count'] += 1
+        tool['failed'] += record['returncode'] not in (0, None)
+        tool['timed_out'] += record['timed_out']
+        tool['wall_time'] = round(tool['wall_time'] + (record['wall_time'] or 0), 4)
+        tool['cpu_time'] = round(tool['cpu_time'] + (record['cpu_time'] or 0), 4)
+    return summary
+
+
+def _work_paths(argv, cwd=None):
+    """The directories in which argv may create files, make's -C directory
+    or else the cwd the caller gives, and the files it names with -o. The
+    grader's own working directory is not scanned."""
+    directories = set()
+    if cwd:
+        directories = {os.path.abspath(cwd)}
+    paths = set()
+    for option, value in zip(argv, argv[1:]):
+        if option == '-C':
+            directories = {os.path.abspath(value)}
+        elif option == '-o':
+            paths.add(os.path.abspath(os.path.join(cwd or '', value)))
+    return (directories, paths)
+
+
+def _replay(argv, tool, timeout, key):
+    """Serve the call key from the tape, see replay.py."""
+    result = replayed(key)
+    if result is None:
+        record_execution(tool, 127)
+        return subprocess.CompletedProcess(
+            argv, 127, '', f'{tool}: not on the tape\n'
+        )
+    if result['timed_out']:
+        record_execution(tool, None, timed_out=True)
+        raise subprocess.TimeoutExpired(argv, timeout)
+    proc = subprocess.CompletedProcess(
+        argv, result['returncode'], result['stdout'], result['stderr']
+    )
+    proc.truncated = result['truncated']
+    proc.usage = result['usage']
+    record_execution(tool, proc.returncode, proc.usage)
+    return proc
+
+
+def execute(argv, timeout=None, timeouts=None, **keywords):
+    """Run argv, a list of the program and its arguments, without a shell
+    and return a subprocess.CompletedProcess with its text output, see
+    capture.run_captured(). timeout defaults to the tool's timeout.
+    Raises subprocess.TimeoutExpired like subprocess.run(). A program that
+    cannot be started exits with 127 and the reason in stderr, as it
+    would from a shell. GRADER_EXEC_MODE records every call on a tape or
+    replays calls from one, see replay.py."""
+    logger = setup_logger()
+    argv = [str(arg) for arg in argv]
+    tool = tool_name(argv)
+    if timeout is None:
+        timeout = tool_timeout(tool, timeouts)
+    mode = exec_mode()
+    key = None
+    if mode:
+        key = tape_key('execute', argv, keywords.get('input'), keywords.get('cwd'))
+    if mode == 'replay':
+        logger.debug('Replaying %s', ' '.join(argv))
+        return _replay(argv, tool, timeout, key)
+    logger.debug('Running %s', ' '.join(argv))
+    if mode == 'record':
+        directories, paths = _work_paths(argv, keywords.get('cwd'))
+        before = list_files(directories, paths)
+    try:
+        proc = run_captured(argv, timeout=timeout, **keywords)
+    except subprocess.TimeoutExpired:
+        record_execution(tool, None, timed_out=True)
+        if mode == 'record':
+            record(key, {'timed_out': True})
+        raise
+    except OSError as exception:
+        logger.warning('Cannot run %s: %s', tool, exception)
+        record_execution(tool, 127)
+        return subprocess.CompletedProcess(argv, 127, '', f'{tool}: {exception}\n')
+    record_execution(tool, proc.returncode, proc.usage)
+    if mode == 'record':
+        record(
+            key,
+            {
+                'timed_out': False,
+                'returncode': proc.returncode,
+                'stdout': proc.stdout,
+                'stderr': proc.stderr,
+                'truncated': proc.truncated,
+                'usage': proc.usage,
+            },
+            created_files(before, directories, paths),
+        )
+    return proc
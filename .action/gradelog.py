@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Keep every grading run in a SQLite database that many grader
+    processes can append to at once, and export it in the gradelog CSV's
+    columns.
+    Usage:
+    .action/gradelog.py export grades.sqlite grades.csv [--all]
+    .action/gradelog.py history grades.sqlite repo-name [part-1]
+    """
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from logger import setup_logger
+
+import lab_config as cfg
+
+# The columns of a gradelog row, in the order they are written
+GRADELOG_FIELDS = [
+    'Repo Name',
+    'Part',
+    'Author',
+    'Partner1',
+    'Partner2',
+    'Partner3',
+    'PartnerN',
+    'Header',
+    'Formatting',
+    'Linting',
+    'Build',
+    'Tests',
+    'UnitTests',
+    'Notes',
+    'UnitTestNotes',
+    'DaysLate',
+    # Newer columns go last so that existing readers of the CSV still
+    # find the original columns where they were.
+    'UnitTestTimes',
+    'UnitTestUsage',
+    'TestDetails',
+]
+
+# One row per grading run. The gradelog row is kept whole as JSON so that
+# new columns need no migration; the columns runs are looked up by are
+# copied out of it and indexed.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    graded_at TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    part TEXT NOT NULL,
+    author TEXT,
+    commit_hash TEXT,
+    row TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_repo ON runs (repo, part, graded_at);
+CREATE INDEX IF NOT EXISTS runs_part ON runs (part);
+CREATE INDEX IF NOT EXISTS runs_author ON runs (author);
+CREATE INDEX IF NOT EXISTS runs_commit ON runs (commit_hash);
+"""
+
+
+def default_gradelog_db():
+    """The database set with GRADER_GRADELOG_DB, or lab['gradelog_db'];
+    None when there is none."""
+    return os.environ.get('GRADER_GRADELOG_DB') or cfg.lab.get('gradelog_db')
+
+
+def gradelog_db_path(db_path, repo_root):
+    """Where the database db_path is for the repository at repo_root: ~
+    is the user's home directory and {repo_root} the repository's root,
+    which gives each repository a database of its own."""
+    return os.path.expanduser(db_path.replace('{repo_root}', repo_root))
+
+
+def connect(db_path):
+    """Open the gradelog database, creating it when needed. WAL mode lets
+    readers work while a grader writes, and the busy timeout makes
+    concurrent writers wait their turn instead of failing."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    connection = sqlite3.connect(db_path, timeout=60)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    with connection:
+        connection.executescript(_SCHEMA)
+    return connection
+
+
+def record_run(db_path, row, commit_hash=None, graded_at=None):
+    """Append one gradelog row to the database as a new grading run."""
+    if not graded_at:
+        graded_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    connection = connect(db_path)
+    try:
+        with connection:
+            connection.execute(
+                'INSERT INTO runs (graded_at, repo, part, author, commit_hash, row)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    graded_at,
+                    row.get('Repo Name', ''),
+                    row.get('Part', ''),
+                    row.get('Author'),
+                    commit_hash,
+                    json.dumps(row),
+                ),
+            )
+    finally:
+        connection.close()
+
+
+def _run_rows(cursor):
+    """Yield the gradelog rows of a query over runs, one at a time, with
+    the run's time and commit added."""
+    for graded_at, commit_hash, row in cursor:
+        row = json.loads(row)
+        row['Graded At'] = graded_at
+        row['Commit'] = commit_hash or ''
+        yield row
+
+
+def history(db_path, repo=None, part=None, author=None):
+    """Yield every grading run, oldest first, optionally only those of a
+    repository, part, or author."""
+    conditions = []
+    values = []
+    for column, value in (('repo', repo), ('part', part), ('author', author)):
+        if value:
+            conditions.append(f'{column} = ?')
+            values.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    connection = connect(db_path)
+    try:
+        yield from _run_rows(
+            connection.execute(
+                f'SELECT graded_at, commit_hash, row FROM runs {where}'
+                ' ORDER BY graded_at, id',
+                values,
+            )
+        )
+    finally:
+        connection.close()
+
+
+def latest_runs(db_path):
+    """Yield the most recent grading run of every repository and part."""
+    connection = connect(db_path)
+    try:
+        yield from _run_rows(
+            connection.execute(
+                'SELECT graded_at, commit_hash, row FROM runs WHERE id IN'
+                ' (SELECT MAX(id) FROM runs GROUP BY repo, part)'
+                ' ORDER BY repo, part'
+            )
+        )
+    finally:
+        connection.close()
+
+
+def export_csv(db_path, csv_path, all_runs=False):
+    """Write the latest run of every repository and part, or every run,
+    to a CSV file with the gradelog's columns followed by when the run
+    was graded and at which commit. Returns the number of rows."""
+    rows = history(db_path) if all_runs else latest_runs(db_path)
+    count = 0
+    with open(csv_path, 'w', encoding='UTF-8', newline='') as csv_handle:
+        writer = csv.DictWriter(
+            csv_handle,
+            GRADELOG_FIELDS + ['Graded At', 'Commit'],
+            extrasaction='ignore',
+        )
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def main():
+    """Export the gradelog database to CSV or print a repository's
+    grading history."""
+    logger = setup_logger()
+    if len(sys.argv) < 4 or sys.argv[1] not in ('export', 'history'):
+        logger.error(
+            'Usage: %s export DB CSV [--all] | history DB REPO [PART]', sys.argv[0]
+        )
+        sys.exit(1)
+    if sys.argv[1] == 'export':
+        count = export_csv(sys.argv[2], sys.argv[3], '--all' in sys.argv[4:])
+        logger.info('Exported %d rows to %s', count, sys.argv[3])
+    else:
+        part = sys.argv[4] if len(sys.argv) > 4 else None
+        for row in history(sys.argv[2], repo=sys.argv[3], part=part):
+            print(
+                f"{row['Graded At']} {row['Commit'][:10]:10} {row['Part']:8} "
+                f"Build {row.get('Build', '')} Tests {row.get('Tests', '')} "
+                f"UnitTests {row.get('UnitTests', '')}"
+            )
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
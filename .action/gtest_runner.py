@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+""" Run a Google Test program in parallel shards. Each shard is its own
+    process with its own timeout, and its output is parsed line by line
+    while it runs, so the results of the tests that finished survive a
+    test that hangs or crashes; the tests after it continue in a new
+    process. Each process runs limited in a process group of its own, see
+    sandbox.py. """
+
+import os.path
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from accounting import combine_usage, new_usage_report, wait_accounted
+from capture import read_lines
+from execute import execute, record_execution
+from logger import in_log_context, setup_logger
+from replay import exec_mode, record, replayed, tape_key
+from sandbox import kill_process_group, launcher_argv, resolve_limits
+from tracing import span
+
+# Google Test's progress lines, for example
+# [ RUN      ] BlackJack.IsAce
+# [       OK ] BlackJack.IsAce (0 ms)
+# [  FAILED  ] BlackJack.IsBust (501 ms)
+RUN_REGEX = re.compile(r'^\[ RUN      \] (\S+)')
+END_REGEX = re.compile(
+    r'^\[\s*(OK|FAILED|SKIPPED)\s*\] (\S+?)(?:, where .*)? \((\d+) ms\)'
+)
+# Seconds a shard whose tests all ended has to exit before it is killed
+EXIT_GRACE = 1
+
+
+def list_gtests(binary, time_out=10, limits=None):
+    """Return the full names, Suite.Test, of the tests in a Google Test
+    program using --gtest_list_tests."""
+    logger = setup_logger()
+    try:
+        proc = execute(
+            launcher_argv([binary, '--gtest_list_tests'], resolve_limits(limits)),
+            timeout=time_out,
+        )
+    except subprocess.TimeoutExpired:
+        logger.error('Listing the unit tests in %s timed out', binary)
+        return []
+    tests = []
+    suite = ''
+    for line in proc.stdout.splitlines():
+        if not line.strip():
+            continue
+        # Parameterized tests are followed by a comment such as
+        # '  # GetParam() = 3'
+        name = line.split('#')[0].strip()
+        if not line.startswith(' '):
+            suite = name
+        else:
+            tests.append(f'{suite}{name}')
+    return tests
+
+
+def split_into_shards(tests, shards):
+    """Divide the tests round-robin into at most shards lists."""
+    shards = max(1, min(shards, len(tests)))
+    return [tests[index::shards] for index in range(shards)]
+
+
+def _failed_result(test, message):
+    """The result of a test that did not report its own result."""
+    return {'name': test, 'passed': False, 'failures': [message], 'time_ms': None}
+
+
+def parse_gtest_stream(lines):
+    """Given Google Test's output one line at a time, yield a tuple of the
+    test that started running, or None, and the result of the test that
+    just ended, or None. Lines between a test's start and end are its
+    failure messages."""
+    running = None
+    messages = []
+    for line in lines:
+        match = RUN_REGEX.match(line)
+        if match:
+            running = match.group(1)
+            messages = []
+            yield (running, None)
+            continue
+        match = END_REGEX.match(line)
+        if match and match.group(2) == running:
+            outcome, name, milliseconds = match.groups()
+            failures = []
+            if outcome == 'FAILED':
+                failures = ['\n'.join(messages).strip() or 'Failed.']
+            running = None
+            yield (None, {
+                'name': name,
+                'passed': outcome != 'FAILED',
+                'failures': failures,
+                'time_ms': int(milliseconds),
+            })
+        elif running:
+            messages.append(line)
+
+
+def run_gtest_shard(
+    binary, tests, time_out, work_dir, max_failures=None, limits=None
+):
+    """Run the given tests in one process, collecting each result as soon
+    as the test ends. Each test may run for time_out seconds. Returns a
+    tuple of the dictionary of test name to result, the test that was
+    running when the process stopped, why it stopped: 'finished', 'timed
+    out', 'crashed', or 'stopped' when max_failures tests failed, and the
+    process's usage, see accounting.wait_accounted()."""
+    logger = setup_logger()
+    argv = [binary, f"--gtest_filter={':'.join(tests)}", '--gtest_color=no']
+    start = time.monotonic()
+    # Each test gets time_out seconds from the moment it starts.
+    deadline = {'at': start + time_out}
+    results = {}
+    running = None
+    reason = 'finished'
+    failures = 0
+    report_path = new_usage_report()
+    # pylint: disable-next=consider-using-with
+    proc = subprocess.Popen(
+        launcher_argv(argv, resolve_limits(limits), report_path),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        cwd=work_dir,
+        start_new_session=True,
+    )
+    try:
+        lines = read_lines(proc.stdout, lambda: deadline['at'])
+        for running, result in parse_gtest_stream(lines):
+            if not result:
+                deadline['at'] = time.monotonic() + time_out
+                continue
+            results[result['name']] = result
+            failures += not result['passed']
+            if len(results) == len(tests):
+                # Every result is in; do not wait for the process to exit.
+                break
+            if max_failures and failures >= max_failures:
+                reason = 'stopped'
+                break
+        else:
+            if running and time.monotonic() >= deadline['at']:
+                reason = 'timed out'
+                logger.warning('Unit test %s timed out', running)
+            elif running:
+                reason = 'crashed'
+                logger.warning('Unit test %s crashed', running)
+            elif len(results) != len(tests):
+                reason = 'crashed'
+    finally:
+        if reason == 'finished':
+            # Let the program exit so that its usage is reported.
+            _, usage = wait_accounted(
+                proc, start, time.monotonic() + EXIT_GRACE, report_path
+            )
+        else:
+            kill_process_group(proc.pid)
+            _, usage = wait_accounted(proc, start, report_path=report_path)
+        # Tests may leave processes behind even when the program exited.
+        kill_process_group(proc.pid)
+        proc.stdout.close()
+        record_execution(
+            os.path.basename(binary), proc.returncode, usage, reason == 'timed out'
+        )
+    return (results, running, reason, usage)
+
+
+def run_gtests(
+    binary, shards=4, time_out=10, work_dir=None, max_failures=None, limits=None
+):
+    """Run every test of a Google Test program in parallel shards. Returns
+    a tuple of the list of test results in the order the tests are listed
+    and the usage of all the test processes together, see
+    accounting.combine_usage().
+    Each test may run for time_out seconds from when it starts. When a
+    test hangs or crashes, it is marked as failed and the rest of its
+    shard continues in a new process. With max_failures, a shard stops
+    early once that many of its tests failed. limits overrides
+    sandbox.DEFAULT_LIMITS for every process. GRADER_EXEC_MODE records
+    or replays the whole run, see replay.py."""
+    mode = exec_mode()
+    if not mode:
+        return _run_gtests(binary, shards, time_out, work_dir, max_failures, limits)
+    key = tape_key('unittest', os.path.abspath(binary), shards, max_failures)
+    if mode == 'replay':
+        result = replayed(key)
+        if result is None:
+            return ([], None)
+        results, usage = result
+        record_execution(os.path.basename(binary), 0, usage)
+        return (results, usage)
+    result = _run_gtests(binary, shards, time_out, work_dir, max_failures, limits)
+    record(key, result)
+    return result
+
+
+def _run_gtests(binary, shards, time_out, work_dir, max_failures, limits):
+    """Run the tests of binary, see run_gtests()."""
+    logger = setup_logger()
+    if not work_dir:
+        work_dir = os.path.dirname(os.path.abspath(binary))
+    binary = os.path.abspath(binary)
+    tests = list_gtests(binary, limits=limits)
+    if not tests:
+        logger.warning('No unit tests found in %s', binary)
+        return ([], None)
+
+    start = time.monotonic()
+    usages = []
+
+    def run_shard(shard):
+        results = {}
+        remaining = shard
+        while remaining:
+            with span('unittest shard', 'subprocess', tests=len(remaining)):
+                shard_results, running, reason, usage = run_gtest_shard(
+                    binary, remaining, time_out, work_dir, max_failures, limits
+                )
+            usages.append(usage)
+            results.update(shard_results)
+            remaining = [test for test in remaining if test not in results]
+            if reason == 'stopped':
+                for test in remaining:
+                    results[test] = _failed_result(
+                        test, f'Not run; stopped after {max_failures} failures.'
+                    )
+            elif running in remaining:
+                results[running] = _failed_result(running, f'Test {reason}.')
+                remaining.remove(running)
+            else:
+                # The program stopped before any test started.
+                for test in remaining:
+                    results[test] = _failed_result(test, f'Test {reason}.')
+            remaining = [test for test in remaining if test not in results]
+        return results
+
+    merged = {}
+    with ThreadPoolExecutor(max_workers=shards) as executor:
+        shard_results = executor.map(
+            in_log_context(run_shard), split_into_shards(tests, shards)
+        )
+        for results in shard_results:
+            merged.update(results)
+    usage = combine_usage(usages)
+    if usage:
+        # Shards restart after a hang or crash, so time the whole run.
+        usage['wall_time'] = round(time.monotonic() - start, 4)
+    return ([merged[test] for test in tests], usage)
+
+
+def gtest_duration_limit(unittest_source, default=None):
+    """Return the MAX_DURATION_MS a unit test source file defines for its
+    duration assertions, or default when it defines none."""
+    limit = default
+    try:
+        with open(unittest_source, 'r', encoding='UTF-8') as file_handle:
+            match = re.search(
+                r'^#define\s+MAX_DURATION_MS\s+(\d+)', file_handle.read(), re.M
+            )
+        if match:
+            limit = int(match.group(1))
+    except OSError:
+        pass
+    return limit
+
+
+def slow_gtests(results, limit_ms, fraction=0.8):
+    """Return the results of the tests that took at least fraction of
+    limit_ms, the tests that are close to failing on time alone."""
+    if not limit_ms:
+        return []
+    return [
+        result
+        for result in results
+        if result['time_ms'] is not None
+        and result['time_ms'] >= fraction * limit_ms
+    ]
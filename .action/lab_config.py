@@ -7,6 +7,101 @@ from datetime import date
 # A list of target names in the order of the lab's parts.
 targets = 'sandwich blackjack'.split()
 
+# Test cases for each part's program. Each test case is a dictionary with
+#   'args': the command line arguments
+#   'stdin': text written to standard input (optional)
+#   'expect': a regular expression searched for in stdout and stderr
+#   'exit': 'zero' or 'nonzero', the expected kind of exit code
+#   'timeout': seconds before the program is stopped (optional)
+#   'hint': what the output should look like, shown when the test fails
+sandwich_error_hint = 'error: you must supply three arguments'
+sandwich_tests = [
+    {'args': args, 'expect': r'(?i)\s*error:.+', 'exit': 'nonzero',
+     'hint': sandwich_error_hint}
+    for args in (
+        [],  # 0 arguments, too few
+        ['ham'],  # 1 arguments, too few
+        ['ham', 'rye'],  # 2 arguments, too few
+        ['ham', 'rye', 'tomato', 'lettuce'],  # 4 arguments, too many
+    )
+] + [
+    {
+        'args': [protein, bread, condiment],
+        'expect': (
+            rf'(?i)\s*Your\s+order.?\s+A\s+{protein}\s+sandwich\s+on\s+'
+            rf'{bread}\s+with\s+{condiment}.?\s*'
+        ),
+        'exit': 'zero',
+        'hint': f'Your order:\nA {protein} sandwich on {bread} with {condiment}.',
+    }
+    for protein, bread, condiment in (
+        ('ham', 'rye', 'mayo'),
+        ('tuna', 'wheat', 'mustard'),
+        ('roast beef', 'kaiser roll', 'horse radish and mayo'),
+        ('salami', 'white', 'cheddar'),
+    )
+]
+
+card_names = 'A 2 3 4 5 6 7 8 9 10 J Q K'.split()
+
+
+def blackjack_score(card_1, card_2):
+    """The score of a two card blackjack hand."""
+    points = {name: min(index + 1, 10) for index, name in enumerate(card_names)}
+    score = points[card_1] + points[card_2]
+    if 'A' in (card_1, card_2) and score + 10 <= 21:
+        score += 10
+    return score
+
+
+def blackjack_hand_test(card_1, card_2):
+    """A test case for the score of a valid two card hand; the first
+    number the program prints must be the score."""
+    score = blackjack_score(card_1, card_2)
+    return {
+        'args': [card_1, card_2],
+        'expect': rf'\A\D*\b{score}(?!\d)',
+        'exit': 'zero',
+        'hint': str(score),
+    }
+
+
+blackjack_tests = [
+    {'args': args, 'expect': r'(?i)\s*error:.+', 'exit': 'nonzero',
+     'hint': f'error: {message}'}
+    for args, message in (
+        # wrong number of arguments
+        ([''], 'you must supply two arguments'),
+        (['A'], 'you must supply two arguments'),
+        (['A', 'A', 'A'], 'you must supply two arguments'),
+        # invalid card name
+        (['X', 'A'], 'invalid card name'),
+        (['A', 'X'], 'invalid card name'),
+        (['X', 'X'], 'invalid card name'),
+    )
+] + [
+    blackjack_hand_test(card_1, card_2)
+    for card_1, card_2 in (
+        # no ace
+        ('2', '3'),
+        ('5', 'Q'),
+        ('K', 'J'),
+        # ace counts as 11
+        ('A', '10'),
+        ('5', 'A'),
+        # ace counts as 1
+        ('A', 'A'),
+    )
+]
+
+# All 169 two card hands. To grade every hand, add these to the part's
+# 'tests'.
+blackjack_all_hands = [
+    blackjack_hand_test(card_1, card_2)
+    for card_1 in card_names
+    for card_2 in card_names
+]
+
 lab = {
     # Due date for labs
     'mon_duedate': date(2023, 10, 25),
@@ -16,6 +111,23 @@ lab = {
     'makefile_name': 'Makefile',
     # Prefix Makefiles with a period to hid them
     'hidden_makefiles': False,
+    # Each grading job copies a part into a private directory created here
+    # and builds there. None uses the system's temporary directory; use
+    # '/dev/shm' to build on tmpfs. GRADER_SCRATCH_ROOT overrides this.
+    'scratch_root': None,
+    # A SQLite database every grading run of every repository is appended
+    # to; see gradelog.py. {repo_root} in the path stands for the graded
+    # repository, e.g. '{repo_root}/.gradelog.sqlite' keeps one database
+    # per repository. None writes only the CSV. GRADER_GRADELOG_DB
+    # overrides this.
+    'gradelog_db': '~/.cache/grader-gradelog.sqlite',
+    # Every stage's results are appended as JSON lines to this file; see
+    # events.py. None uses .{repo}_{part}_events.jsonl next to the
+    # gradelog CSV.
+    'event_log': None,
+    # Seconds each external tool may run, by program name, e.g.
+    # {'clang-tidy': 120}; see execute.DEFAULT_TOOL_TIMEOUTS.
+    'tool_timeouts': {},
     # Configuration of target, source files, and header files for each part. These are the files
     # that will be checked for headers, format, and lint.
     # other_src and other_header are files that are needed for building and are not graded/assessed.
@@ -30,7 +142,25 @@ lab = {
             'header': '',
             'other_src': '',
             'other_header': '',
-            'test_main': 'run_p1',
+            'tests': sandwich_tests,
+            # Run the program attached to a pseudo-terminal instead of pipes
+            'use_pty': False,
+            # Compare the program with a reference implementation from
+            # differential.py over all inputs, e.g.
+            # {'target': 'blackjack', 'random_inputs': 200, 'seed': 0}
+            'differential': None,
+            # An instructor's reference program. Its results for every input
+            # are cached once per lab (oracle.py) in oracle_cache, by default
+            # next to the program. Test cases without 'expect' and
+            # differential tests then use those results.
+            'reference_binary': None,
+            'oracle_cache': None,
+            # Seconds a test may run before it is killed, unless the test
+            # sets its own 'timeout'. With calibrate_timeouts it is scaled
+            # by how fast and busy the grading host is (calibration.py) and
+            # never below ten times the reference program's runtime.
+            'test_timeout': 1,
+            'calibrate_timeouts': True,
         },
         {
             'target': targets[1],
@@ -38,7 +168,13 @@ lab = {
             'header': f'{targets[1]}_functions.h',
             'other_src': '',
             'other_header': '',
-            'test_main': 'run_p2',
+            'tests': blackjack_tests,
+            'use_pty': False,
+            'differential': None,
+            'reference_binary': None,
+            'oracle_cache': None,
+            'test_timeout': 1,
+            'calibrate_timeouts': True,
         },
     ],
 }
@@ -118,10 +254,51 @@ tidy_compiler_options = (
 # be used as a command line option.
 global_tidy_options_string = f'{global_tidy_checks} {global_tidy_config}'
 
+# Named sets of compiler and linker flags. The Makefile builds with the
+# 'student' profile unless BUILD_PROFILE names another one, which lets the
+# grader pick a faster profile without changing what students build with.
+build_profiles = {
+    'student': {
+        'CXXFLAGS': '-g -O3 -Wall -pedantic -pipe -std=c++17',
+        'LDFLAGS': '-g -O3 -Wall -pedantic -pipe -std=c++17',
+    },
+    # No debug information and no optimization; graded runs of small
+    # programs do not benefit from either and compile much faster without.
+    'grade-fast': {
+        'CXXFLAGS': '-O0 -Wall -pedantic -pipe -std=c++17',
+        'LDFLAGS': '-O0 -pipe -std=c++17',
+    },
+}
+
+# Limits on the student programs and unit tests the grader runs; see
+# sandbox.DEFAULT_LIMITS for the defaults. None lifts a limit. The process
+# limit counts every process of the user running the grader.
+sandbox_limits = {
+    'cpu_seconds': 10,
+    'memory_bytes': 1024 * 1024 * 1024,
+    'processes': 512,
+    'file_size_bytes': 16 * 1024 * 1024,
+    # Only the first and last half of this many bytes of a program's
+    # output are kept.
+    'output_bytes': 1024 * 1024,
+}
+
 global_makefile = {
     'CXX': 'clang++',
-    'CXXFLAGS': '-g -O3 -Wall -pedantic -pipe -std=c++17',
-    'LDFLAGS': '-g -O3 -Wall -pedantic -pipe -std=c++17',
+    'CXXFLAGS': build_profiles['student']['CXXFLAGS'],
+    'LDFLAGS': build_profiles['student']['LDFLAGS'],
+    'build_profiles': build_profiles,
+    # The profile the grader builds with
+    'grade_profile': 'grade-fast',
+    # Parse all sources with -fsyntax-only before the costly stages. When
+    # a submission does not compile, 'skip' skips lint, unit tests, and the
+    # build; 'downgrade' lints without a compile DB and skips the rest;
+    # 'continue' runs everything.
+    'syntax_precheck': True,
+    'on_syntax_error': 'skip',
+    # Build with clang's -ftime-trace and summarize where compile time went
+    # in the gradelog. GRADER_TIME_TRACE=1 turns this on for one run.
+    'time_trace': False,
     # Linting & Formatting tests
     'do_format_check': True,
     'do_lint_check': True,
@@ -130,6 +307,18 @@ global_makefile = {
     'skip_compile_cmd': False,
     # Google Test & Google Mock
     'do_unit_tests': False,
+    # Unit tests run in this many parallel processes. A test that runs
+    # longer than unittest_timeout seconds is stopped.
+    'unittest_shards': 4,
+    'unittest_timeout': 10,
+    # Stop a shard once this many of its tests failed; None runs them all.
+    'unittest_max_failures': None,
+    # Tests that take at least unittest_slow_fraction of the unit tests'
+    # MAX_DURATION_MS (unittest_max_duration_ms when not defined) are
+    # flagged in the gradelog.
+    'unittest_max_duration_ms': 500,
+    'unittest_slow_fraction': 0.8,
+    'sandbox_limits': sandbox_limits,
     'gtest_dependencies': '$(TARGET)_functions.o $(TARGET)_unittest.cc',
     # pylint: disable-next=line-too-long
     'gtest_compile_cmd': '@$(CXX) $(GTESTINCLUDE) $(LDFLAGS) -o unittest $(TARGET)_unittest.cc $(TARGET)_functions.o $(GTESTLIBS)',
@@ -25,32 +25,175 @@
 # POSSIBILITY OF SUCH DAMAGE.
 #
 """ Local logger setup. Used across all the different bits and pieces
-    in the GitHub actions. """
+    in the GitHub actions.
 
+    Records are put on a queue and written to stdout by a listener
+    thread, so logging never waits on the terminal. While a job, the
+    grading of one repository's part, runs under job_context(), its lines
+    carry the repository, part, and stage and are held back, then written
+    in one block when the job ends, so the logs of jobs graded in
+    parallel do not interleave. GRADER_LOG_LEVEL sets the level, e.g.
+    DEBUG; set_log_level() changes it while running. """
+
+import atexit
+import contextlib
+import contextvars
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 
 MSHAFAE_LOGGER = None
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(context)s%(message)s'
+# A job's lines are written early once this many are held back
+MAX_BUFFERED_RECORDS = 10000
+
+_JOB = contextvars.ContextVar('grader_log_job', default=None)
+_STAGE = contextvars.ContextVar('grader_log_stage', default=None)
+_STATE = {'queue': None, 'listener': None}
+
+
+def log_level():
+    """The level from GRADER_LOG_LEVEL, a name or number, or INFO."""
+    level = os.environ.get('GRADER_LOG_LEVEL', 'INFO').strip().upper()
+    if level.isdigit():
+        return int(level)
+    value = logging.getLevelName(level)
+    return value if isinstance(value, int) else logging.INFO
+
+
+def set_log_level(level):
+    """Log records of level, a name or number, and above from now on."""
+    setup_logger().setLevel(level.upper() if isinstance(level, str) else level)
+
+
+def _add_context(record):
+    """Label a record with the job and stage it was logged in. Runs in the
+    thread that logs."""
+    job = _JOB.get()
+    stage = _STAGE.get()
+    record.job = job
+    record.context = ''
+    if job:
+        record.context = f'[{job}{" " + stage if stage else ""}] '
+    return True
+
+
+class _JobBufferHandler(logging.StreamHandler):
+    """Write records outside a job at once and hold back the records of
+    each job until it ends. Runs in the listener thread."""
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.buffers = {}
+
+    def emit(self, record):
+        flush_job = getattr(record, 'flush_job', None)
+        job = getattr(record, 'job', None)
+        if flush_job:
+            self.flush_job(flush_job)
+        elif not job:
+            super().emit(record)
+        else:
+            try:
+                lines = self.buffers.setdefault(job, [])
+                lines.append(self.format(record))
+            # pylint: disable-next=broad-exception-caught
+            except Exception:
+                self.handleError(record)
+                return
+            if len(lines) >= MAX_BUFFERED_RECORDS:
+                self.flush_job(job)
+
+    def flush_job(self, job):
+        """Write the lines held back for job in one write."""
+        lines = self.buffers.pop(job, None)
+        if not lines:
+            return
+        self.acquire()
+        try:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        for job in list(self.buffers):
+            self.flush_job(job)
+        super().close()
+
+
+def _stop_listener():
+    """Write every queued record before the process exits."""
+    listener = _STATE['listener']
+    if listener:
+        _STATE['listener'] = None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
 
 
 def setup_logger():
     """Set up the logger to output to stdout."""
     # https://docs.python.org/3/howto/logging.html#logging-basic-tutorial
-    # https://stackoverflow.com/questions/14058453/making-python-loggers-output-all-messages-to-stdout-in-addition-to-log-file
-    # root = logging.getLogger()
+    # https://docs.python.org/3/howto/logging-cookbook.html
     # pylint: disable-next=global-statement
     global MSHAFAE_LOGGER
     if not MSHAFAE_LOGGER:
         logger = logging.getLogger()
-        logger.setLevel(logging.INFO)
-        # logger.setLevel(logging.DEBUG)
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(logging.INFO)
-        # handler.setLevel(logging.DEBUG)
-        formatter = logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s'
+        logger.setLevel(log_level())
+        handler = _JobBufferHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(_add_context)
+        listener = logging.handlers.QueueListener(
+            log_queue, handler, respect_handler_level=True
         )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        listener.start()
+        _STATE['queue'] = log_queue
+        _STATE['listener'] = listener
+        atexit.register(_stop_listener)
+        logger.addHandler(queue_handler)
         MSHAFAE_LOGGER = logger
     return MSHAFAE_LOGGER
+
+
+@contextlib.contextmanager
+def job_context(repo_name, part_name):
+    """Label the records logged in the body of the with statement with
+    the job and write them in one block when it ends."""
+    setup_logger()
+    job = f'{repo_name} {part_name}'
+    token = _JOB.set(job)
+    try:
+        yield
+    finally:
+        _JOB.reset(token)
+        if _STATE['queue']:
+            _STATE['queue'].put(
+                logging.makeLogRecord({'flush_job': job, 'levelno': logging.NOTSET})
+            )
+
+
+@contextlib.contextmanager
+def log_stage(stage):
+    """Label the records logged in the body of the with statement with
+    the stage of grading, e.g. 'build'."""
+    token = _STAGE.set(stage)
+    try:
+        yield
+    finally:
+        _STAGE.reset(token)
+
+
+def in_log_context(function):
+    """Return function wrapped to log in the job and stage of the caller
+    when another thread, e.g. a ThreadPoolExecutor's, calls it."""
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **keywords):
+        return context.copy().run(function, *args, **keywords)
+
+    return run_in_context
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Time the pure Python functions the grader calls thousands of times per
+    deadline on fixed inputs, check that they still give the same
+    results, and compare their times with a baseline so that a change
+    that slows one of them down is caught before it reaches the fleet.
+
+    ex.
+    .action/microbench.py --save          # store the baseline
+    .action/microbench.py                 # compare with it
+    .action/microbench.py dict_header_valid regex_it
+"""
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from assessment import has_main_function
+from benchmark import RESULTS_DIR
+from gtest_runner import parse_gtest_stream
+from logger import setup_logger
+from parse_header import dict_header, split_partners
+from solution_check import regex_it
+
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'microbench.json')
+# A benchmark regresses when it is this much slower than its baseline
+DEFAULT_TOLERANCE = 0.25
+# Times each benchmark is repeated; the fastest repeat is kept
+REPEAT = 5
+
+VALID_HEADER = (
+    '// Tuffy Titan\n'
+    '// tuffy@csu.fullerton.edu\n'
+    '// @tuffy\n'
+    '// Partners: @AdaLovelace, @grace-hopper\n'
+    '\n#include <iostream>\n'
+)
+MALFORMED_HEADER = (
+    '// Tuffy Titan\n'
+    '// tuffy@gmail.com\n'
+    '// @tuffy\n'
+    '// Partners:\n'
+    '\n#include <iostream>\n'
+)
+FUNCTION = (
+    'int Function{0}(int argc, const char* argv[]) {{\n'
+    '  // Not the main function: int main(int argc, char* argv) is wrong.\n'
+    '  std::vector<std::string> arguments{{argv, argv + argc}};\n'
+    '  return static_cast<int>(arguments.size()) + {0};\n'
+    '}}\n\n'
+)
+EXPECTED_OUTPUT = (
+    'Player 1 has 21 points.\n  Player 2 has 20 points.\n'
+    'The winner is   Player 1!\n'
+) * 20
+# regex_it(EXPECTED_OUTPUT), written out so that the benchmark does not
+# check regex_it against itself
+EXPECTED_REGEX = (
+    r'\s*'
+    + r'\s+'.join(
+        [
+            r'Player\s+1\s+has\s+21\s+points.\s+Player\s+2\s+has\s+20\s+points.'
+            r'\s+The\s+winner\s+is\s+Player\s+1!'
+        ]
+        * 20
+    )
+    + r'\s*'
+)
+
+
+def gtest_output(tests=200):
+    """Google Test's output for tests tests, every tenth failing."""
+    lines = []
+    for number in range(tests):
+        name = f'BlackJack.Test{number}'
+        lines.append(f'[ RUN      ] {name}')
+        if number % 10 == 9:
+            lines += [
+                'blackjack_unittest.cc:42: Failure',
+                'Expected equality of these values:',
+                f'  CardValue("{number}")',
+                '    Which is: 0',
+                f'  {number}',
+                f'[  FAILED  ] {name} ({number} ms)',
+            ]
+        else:
+            lines.append(f'[       OK ] {name} ({number % 7} ms)')
+    return lines
+
+
+def make_benchmarks(work_dir):
+    """Write the fixed inputs to work_dir and return a dictionary of
+    benchmark name to a tuple of the function to time and its expected
+    result."""
+    files = {
+        'valid.cc': VALID_HEADER,
+        'malformed.cc': MALFORMED_HEADER,
+        'main.cc': ''.join(FUNCTION.format(n) for n in range(2000))
+        + 'int main(int argc, char* argv[]) {\n  return 0;\n}\n',
+        'nomain.cc': ''.join(FUNCTION.format(n) for n in range(2000)),
+    }
+    for name, contents in files.items():
+        with open(os.path.join(work_dir, name), 'w', encoding='UTF-8') as file_handle:
+            file_handle.write(contents)
+    path = {name: os.path.join(work_dir, name) for name in files}
+    gtest_lines = gtest_output()
+    return {
+        'dict_header_valid': (
+            lambda: dict_header(path['valid.cc'], silent=True),
+            {
+                'name': 'Tuffy Titan',
+                'email': 'tuffy@csu.fullerton.edu',
+                'github': '@tuffy',
+                'partners': '@AdaLovelace, @grace-hopper',
+            },
+        ),
+        'dict_header_malformed': (
+            lambda: dict_header(path['malformed.cc'], silent=True),
+            {},
+        ),
+        'has_main_function': (lambda: has_main_function(path['main.cc']), True),
+        'has_main_function_none': (
+            lambda: has_main_function(path['nomain.cc']),
+            False,
+        ),
+        'regex_it': (
+            lambda: regex_it(EXPECTED_OUTPUT),
+            EXPECTED_REGEX,
+        ),
+        'parse_gtest_stream': (
+            lambda: sum(
+                not result['passed']
+                for _, result in parse_gtest_stream(gtest_lines)
+                if result
+            ),
+            20,
+        ),
+        'split_partners': (
+            lambda: split_partners('@AdaLovelace, @grace-hopper,@Tuffy  @x'),
+            ['adalovelace', 'grace-hopper', 'tuffy', 'x'],
+        ),
+    }
+
+
+def time_function(function, repeat=REPEAT):
+    """Return the fastest time of one call of function in seconds."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_microbenchmarks(names=None):
+    """Time the benchmarks called names, or all of them, and return a
+    dictionary of name to seconds per call and a list of the benchmarks
+    whose result was wrong."""
+    logger = setup_logger()
+    times = {}
+    wrong = []
+    with tempfile.TemporaryDirectory(prefix='grader-microbench-') as work_dir:
+        benchmarks = make_benchmarks(work_dir)
+        for name in names or benchmarks:
+            if name not in benchmarks:
+                logger.error('Unknown benchmark %s', name)
+                wrong.append(name)
+                continue
+            function, expected = benchmarks[name]
+            result = function()
+            if result != expected:
+                logger.error('%s returned %r, expected %r', name, result, expected)
+                wrong.append(name)
+                continue
+            times[name] = time_function(function)
+    return (times, wrong)
+
+
+def regressions(times, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return the names of the benchmarks more than tolerance slower than
+    in baseline."""
+    return [
+        name
+        for name, seconds in times.items()
+        if name in baseline and seconds > baseline[name] * (1 + tolerance)
+    ]
+
+
+def main():
+    """Run the micro-benchmarks named on the command line, or all of them,
+    and compare them with the baseline or store them as the baseline with
+    --save. Exits with 1 when a result is wrong or a benchmark regressed."""
+    logger = setup_logger()
+    args = sys.argv[1:]
+    save = '--save' in args
+    if save:
+        args.remove('--save')
+    options = {'--baseline': DEFAULT_BASELINE, '--tolerance': DEFAULT_TOLERANCE}
+    for name in ('--baseline', '--tolerance'):
+        if name in args:
+            index = args.index(name)
+            options[name] = args[index + 1]
+            del args[index:index + 2]
+    baseline_path = options['--baseline']
+    tolerance = float(options['--tolerance'])
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, 'r', encoding='UTF-8') as file_handle:
+            baseline = json.load(file_handle)['times']
+    times, wrong = run_microbenchmarks(args)
+    slower = regressions(times, baseline, tolerance)
+    print(f"{'Benchmark':24} {'us/call':>10} {'baseline':>10} {'change':>8}")
+    for name, seconds in times.items():
+        line = f'{name:24} {seconds * 1e6:>10.2f}'
+        if name in baseline:
+            change = 100 * (seconds - baseline[name]) / baseline[name]
+            line += f' {baseline[name] * 1e6:>10.2f} {change:>+7.1f}%'
+        if name in slower:
+            line += '  REGRESSED'
+        print(line)
+    if save:
+        os.makedirs(os.path.dirname(baseline_path) or '.', exist_ok=True)
+        with open(baseline_path, 'w', encoding='UTF-8') as file_handle:
+            json.dump(
+                {
+                    'python': platform.python_version(),
+                    'host': platform.node(),
+                    'times': {**baseline, **times},
+                },
+                file_handle,
+                indent=2,
+            )
+        logger.info('Baseline stored in %s', baseline_path)
+    elif not baseline:
+        logger.warning('No baseline in %s; run with --save to store one', baseline_path)
+    if wrong or (slower and not save):
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+""" A cache of an instructor's reference program's results. The reference
+    runs once per lab for every input; grading a student only looks the
+    expected results up. Results are keyed by the reference program's
+    SHA-256 digest and the input, so rebuilding the reference invalidates
+    them.
+
+    ex.
+    .action/oracle.py part-2 /path/to/reference/blackjack
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from differential import references
+from execute import execute
+from logger import in_log_context, setup_logger
+
+import lab_config as cfg
+
+
+def binary_digest(binary):
+    """Return the SHA-256 digest of a program."""
+    digest = hashlib.sha256()
+    with open(binary, 'rb') as file_handle:
+        for block in iter(lambda: file_handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def oracle_key(args, stdin=None):
+    """The cache key of an input vector."""
+    return json.dumps([[str(arg) for arg in args], stdin])
+
+
+def default_cache_path(reference_binary):
+    """The oracle cache lives next to the reference program."""
+    return f'{reference_binary}.oracle.json'
+
+
+def run_reference(reference_binary, args, stdin=None, time_out=10):
+    """Run the reference program once and return its stdout, stderr, and
+    exit code. 'output' is stdout followed by stderr, which is what a
+    student's program is compared with. 'duration' is the wall time in
+    seconds, used to calibrate timeouts. A run that takes longer than
+    time_out seconds is killed; 'timed_out' is then True, the exit code
+    None, and the output whatever was written until then."""
+    logger = setup_logger()
+    start = time.perf_counter()
+    argv = [reference_binary] + [str(arg) for arg in args]
+    try:
+        proc = execute(argv, input=stdin, timeout=time_out)
+    except subprocess.TimeoutExpired as exception:
+        logger.warning('The reference program timed out on %s', argv[1:])
+        stdout, stderr = [
+            text.decode('UTF-8', errors='replace') if isinstance(text, bytes)
+            else text or ''
+            for text in (exception.output, exception.stderr)
+        ]
+        return {
+            'stdout': stdout,
+            'stderr': stderr,
+            'output': stdout + stderr,
+            'returncode': None,
+            'timed_out': True,
+            'duration': time.perf_counter() - start,
+        }
+    return {
+        'stdout': proc.stdout,
+        'stderr': proc.stderr,
+        'output': proc.stdout + proc.stderr,
+        'returncode': proc.returncode,
+        'timed_out': False,
+        'duration': time.perf_counter() - start,
+    }
+
+
+def load_oracle(reference_binary, cache_path=None):
+    """Return the cached results of this build of the reference program as
+    a dictionary of oracle_key() to result."""
+    if not cache_path:
+        cache_path = default_cache_path(reference_binary)
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, 'r', encoding='UTF-8') as file_handle:
+        cache = json.load(file_handle)
+    return cache.get(binary_digest(reference_binary), {})
+
+
+def save_oracle(reference_binary, results, cache_path=None):
+    """Store the results of this build of the reference program, replacing
+    the results of other builds. Results that timed out are not stored,
+    so they are tried again. The file is replaced atomically so that
+    concurrent graders never read a partial cache."""
+    if not cache_path:
+        cache_path = default_cache_path(reference_binary)
+    cache = {
+        binary_digest(reference_binary): {
+            key: result for key, result in results.items() if not result['timed_out']
+        }
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)))
+    with os.fdopen(fd, 'w', encoding='UTF-8') as file_handle:
+        json.dump(cache, file_handle)
+    os.replace(tmp_path, cache_path)
+
+
+def build_oracle(reference_binary, inputs, cache_path=None, max_workers=None):
+    """Run the reference program on every input, given as (args, stdin)
+    tuples, that is not cached yet and save the cache. Returns the
+    complete dictionary of results."""
+    logger = setup_logger()
+    results = load_oracle(reference_binary, cache_path)
+    missing = {
+        oracle_key(args, stdin): (args, stdin)
+        for args, stdin in inputs
+        if oracle_key(args, stdin) not in results
+    }
+    if missing:
+        logger.info('Running the reference program on %d inputs', len(missing))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            computed = executor.map(
+                in_log_context(lambda item: run_reference(reference_binary, *item)),
+                missing.values(),
+            )
+            results.update(zip(missing.keys(), computed))
+        save_oracle(reference_binary, results, cache_path)
+    return results
+
+
+def oracle_reference(reference_binary, cache_path=None):
+    """Return a function that maps an input to the reference program's
+    result using the cache. An input missing from the cache is run once
+    and remembered for the rest of this process, even when it timed out,
+    so that an input the reference program hangs on costs one timeout."""
+    logger = setup_logger()
+    results = load_oracle(reference_binary, cache_path)
+
+    def reference(args, stdin=None):
+        key = oracle_key(args, stdin)
+        if key not in results:
+            logger.warning('Input %s is not in the oracle cache', key)
+            results[key] = run_reference(reference_binary, args, stdin)
+        return results[key]
+
+    return reference
+
+
+def part_inputs(part_config):
+    """Every input a part is graded with: its test cases and, when
+    differential testing is enabled, the differential inputs."""
+    inputs = [(test['args'], test.get('stdin')) for test in part_config['tests']]
+    settings = part_config.get('differential')
+    if settings:
+        spec = references[settings['target']]
+        inputs += [(args, None) for args in spec['valid_inputs']()]
+        inputs += [
+            (args, None)
+            for args in spec['invalid_inputs'](
+                settings.get('random_inputs', 200), settings.get('seed', 0)
+            )
+        ]
+    return inputs
+
+
+def main():
+    """Build the oracle cache for a part once per lab."""
+    logger = setup_logger()
+    if len(sys.argv) < 3:
+        logger.error('Provide the part, e.g. part-2, and the reference program.')
+        sys.exit(1)
+    part_config = cfg.lab['parts'][int(sys.argv[1].split('-')[-1]) - 1]
+    reference_binary = sys.argv[2]
+    cache_path = part_config.get('oracle_cache') or default_cache_path(reference_binary)
+    results = build_oracle(reference_binary, part_inputs(part_config), cache_path)
+    logger.info('Oracle cache %s holds %d results', cache_path, len(results))
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
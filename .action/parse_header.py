@@ -48,6 +48,12 @@ def null_dict_header():
     return result_dict
 
 
+def split_partners(partners):
+    """Given the Partners field of a header, return the partners' GitHub
+    user names in lower case, e.g. ['tuffy', 'ada'] from '@Tuffy, @ada'."""
+    return partners.replace(',', ' ').replace('@', '').lower().split()
+
+
 def dict_header(file_path, silent=False, comments_startwith='//'):
     """Given a single string, parse the header and return the result
     as a dictionary with the keys class, email, github, asgt, comment.
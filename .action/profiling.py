@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Profile the grader itself when grading one submission takes far
+    longer than it should. Set GRADER_PROFILE to any value to run the
+    grading of each part under cProfile, and GRADER_TRACEMALLOC to the
+    number of stack frames to keep to trace its memory with tracemalloc.
+    The profile, .{repo}_{part}.pstats, and the memory snapshot,
+    .{repo}_{part}.tracemalloc, are written next to the part's gradelog.
+
+    The profiles of a whole fleet are merged to find the hot spots every
+    submission shares.
+
+    ex.
+    .action/profiling.py top */.*.pstats
+    .action/profiling.py merge fleet.pstats */.*.pstats
+    .action/profiling.py memory */.*.tracemalloc
+"""
+
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import tracemalloc
+from logger import setup_logger
+
+# Lines shown by top and memory
+DEFAULT_TOP = 25
+
+
+def profile_enabled():
+    """True when GRADER_PROFILE asks for cProfile."""
+    return bool(os.environ.get('GRADER_PROFILE'))
+
+
+def tracemalloc_frames():
+    """The number of frames GRADER_TRACEMALLOC asks tracemalloc to keep,
+    or 0 when memory is not traced."""
+    try:
+        return max(0, int(os.environ.get('GRADER_TRACEMALLOC') or 0))
+    except ValueError:
+        return 1
+
+
+def profile_paths(repo_root, repo_name, part_name):
+    """The paths of the profile and the memory snapshot of a part."""
+    prefix = os.path.join(repo_root, f'.{repo_name}_{part_name}')
+    return (f'{prefix}.pstats', f'{prefix}.tracemalloc')
+
+
+@contextlib.contextmanager
+def profiled(repo_root, repo_name, part_name):
+    """Profile the body of the with statement as GRADER_PROFILE and
+    GRADER_TRACEMALLOC ask. The results are written however the body
+    ends, including by sys.exit()."""
+    frames = tracemalloc_frames()
+    if not profile_enabled() and not frames:
+        yield
+        return
+    logger = setup_logger()
+    pstats_path, snapshot_path = profile_paths(repo_root, repo_name, part_name)
+    profiler = cProfile.Profile() if profile_enabled() else None
+    if frames and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        if frames:
+            # Snapshot before writing the profile allocates memory.
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.take_snapshot().dump(snapshot_path)
+            tracemalloc.stop()
+            logger.info(
+                'Memory snapshot written to %s, peak %.1f MiB',
+                snapshot_path,
+                peak / 2**20,
+            )
+        if profiler:
+            profiler.dump_stats(pstats_path)
+            logger.info('Profile written to %s', pstats_path)
+
+
+def merge_profiles(paths, output=None):
+    """Add up the profiles in paths and return the pstats.Stats, which
+    is also written to output when given."""
+    stats = pstats.Stats(paths[0], stream=sys.stdout)
+    for path in paths[1:]:
+        stats.add(path)
+    if output:
+        stats.dump_stats(output)
+    return stats
+
+
+def merge_snapshots(paths, top=DEFAULT_TOP):
+    """Add up the memory allocated by each line of code in the tracemalloc
+    snapshots in paths and return the top lines as (size in bytes, count,
+    'file:line') tuples, largest first."""
+    lines = {}
+    for path in paths:
+        snapshot = tracemalloc.Snapshot.load(path)
+        for statistic in snapshot.statistics('lineno'):
+            frame = statistic.traceback[0]
+            key = f'{frame.filename}:{frame.lineno}'
+            size, count = lines.get(key, (0, 0))
+            lines[key] = (size + statistic.size, count + statistic.count)
+    ranked = sorted(
+        ((size, count, key) for key, (size, count) in lines.items()), reverse=True
+    )
+    return ranked[:top]
+
+
+def main():
+    """Merge or summarize the profiles or snapshots named on the command
+    line."""
+    logger = setup_logger()
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] not in ('top', 'merge', 'memory'):
+        logger.error(
+            'Usage: %s top PSTATS... | merge OUTPUT PSTATS... | memory SNAPSHOT...',
+            sys.argv[0],
+        )
+        sys.exit(1)
+    command, paths = args[0], args[1:]
+    if command == 'merge':
+        if len(paths) < 2:
+            logger.error('merge needs an output file and at least one profile')
+            sys.exit(1)
+        merge_profiles(paths[1:], paths[0])
+        logger.info('Merged %d profiles into %s', len(paths) - 1, paths[0])
+    elif command == 'top':
+        stats = merge_profiles(paths)
+        stats.sort_stats('cumulative').print_stats(DEFAULT_TOP)
+        stats.sort_stats('tottime').print_stats(DEFAULT_TOP)
+    else:
+        print(f"{'KiB':>10} {'Blocks':>8}  Line")
+        for size, count, key in merge_snapshots(paths):
+            print(f'{size / 1024:>10.1f} {count:>8}  {key}')
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
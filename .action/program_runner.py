@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+""" Run a student's program once per test case over plain pipes, many
+    test cases at a time, and capture all of its output for matching
+    afterwards. A pseudo-terminal is used only when asked for, for
+    programs that behave differently without one. Every run is limited
+    and killed with its whole process group on timeout, see sandbox.py. """
+# pexpect documentation
+#  https://pexpect.readthedocs.io/en/stable/index.html
+
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pexpect
+from accounting import new_usage_report, read_usage_report, wait_accounted
+from capture import (
+    append_capture,
+    capture_result,
+    capture_streams,
+    new_capture,
+    start_input,
+)
+from execute import record_execution
+from logger import in_log_context
+from replay import exec_mode, record, replayed, tape_key
+from sandbox import (
+    kill_process_group,
+    launcher_argv,
+    resolve_limits,
+)
+from tracing import command_label, span
+
+
+def _run_with_pipes(binary, args, stdin, time_out, limits):
+    """Run the program with stdout and stderr merged into one pipe, keeping
+    at most the limit 'output_bytes' of it, and measure its usage when it
+    is reaped."""
+    start = time.monotonic()
+    deadline = start + time_out
+    report_path = new_usage_report()
+    # pylint: disable-next=consider-using-with
+    proc = subprocess.Popen(
+        launcher_argv([binary] + list(args), resolve_limits(limits), report_path),
+        stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    writer = start_input(proc, stdin.encode('UTF-8') if stdin is not None else None)
+    captured, closed = capture_streams(
+        [proc.stdout], deadline, resolve_limits(limits)['output_bytes']
+    )
+    output, truncated = captured[0]
+    if not closed:
+        kill_process_group(proc.pid)
+    timed_out, usage = wait_accounted(
+        proc, start, deadline if closed else None, report_path
+    )
+    timed_out = timed_out or not closed
+    if writer:
+        writer.join()
+    proc.stdout.close()
+    return (
+        output.decode('UTF-8', errors='replace'),
+        proc.returncode,
+        timed_out,
+        usage,
+        truncated,
+    )
+
+
+def _run_with_pty(binary, args, stdin, time_out, limits):
+    """Run the program attached to a pseudo-terminal using pexpect. The
+    program and its launcher lead a session of their own on the
+    pseudo-terminal. pexpect reaps the launcher, so the wall time is
+    measured here and the rest comes from the launcher's report."""
+    timed_out = False
+    start = time.monotonic()
+    report_path = new_usage_report()
+    command = launcher_argv(
+        [binary] + list(args), resolve_limits(limits), report_path
+    )
+    proc = pexpect.spawn(
+        command[0],
+        args=command[1:],
+        timeout=time_out,
+    )
+    if stdin is not None:
+        proc.send(stdin)
+        proc.sendeof()
+    # Read chunk by chunk rather than expect(EOF) so that the output is
+    # kept within the limit.
+    capture = new_capture(resolve_limits(limits)['output_bytes'])
+    deadline = time.monotonic() + time_out
+    while True:
+        try:
+            chunk = proc.read_nonblocking(
+                65536, timeout=max(0, deadline - time.monotonic())
+            )
+        except pexpect.exceptions.EOF:
+            break
+        except pexpect.exceptions.TIMEOUT:
+            timed_out = True
+            kill_process_group(proc.pid)
+            break
+        append_capture(capture, chunk)
+    output, truncated = capture_result(capture)
+    proc.close(force=True)
+    returncode = proc.exitstatus
+    if returncode is None and proc.signalstatus is not None:
+        returncode = -proc.signalstatus
+    usage = {'wall_time': round(time.monotonic() - start, 4)}
+    usage.update(
+        read_usage_report(report_path) or {'cpu_time': None, 'peak_rss_kb': None}
+    )
+    return (
+        output.decode('UTF-8', errors='replace'),
+        returncode,
+        timed_out,
+        usage,
+        truncated,
+    )
+
+
+def _run_taped(runner, binary, args, stdin, time_out, limits):
+    """Call runner, recording or replaying its result when
+    GRADER_EXEC_MODE asks for it, see replay.py."""
+    mode = exec_mode()
+    if not mode:
+        return runner(binary, args, stdin, time_out, limits)
+    key = tape_key('program', binary, args, stdin, runner.__name__)
+    if mode == 'replay':
+        result = replayed(key)
+        if result is None:
+            return (f'{binary}: not on the tape\n', 127, False, None, False)
+        return tuple(result)
+    result = runner(binary, args, stdin, time_out, limits)
+    record(key, result)
+    return result
+
+
+def run_program(
+    binary, args=(), stdin=None, time_out=1, use_pty=False, limits=None
+):
+    """Run binary with the command line arguments args, writing stdin to
+    its standard input. Returns a dictionary with the timeout, the combined
+    output of stdout and stderr, the exit code (negative for a signal),
+    whether output was dropped to stay within the limit 'output_bytes',
+    whether the program had to be killed after time_out seconds, the wall
+    time, and the CPU time and peak memory in 'cpu_time' and 'peak_rss_kb'
+    as measured by the launcher in sandbox.py, or None when the program
+    was killed. The peak is never below the launcher's few megabytes.
+    limits overrides sandbox.DEFAULT_LIMITS. GRADER_EXEC_MODE records or
+    replays the run, see replay.py."""
+    args = [str(arg) for arg in args]
+    runner = _run_with_pty if use_pty else _run_with_pipes
+    start = time.perf_counter()
+    with span(command_label([binary] + args), 'subprocess', pty=use_pty):
+        output, returncode, timed_out, usage, truncated = _run_taped(
+            runner, binary, args, stdin, time_out, limits
+        )
+    record_execution(os.path.basename(binary), returncode, usage, timed_out)
+    usage = usage or {}
+    return {
+        'args': args,
+        'timeout': time_out,
+        'output': output,
+        'truncated': truncated,
+        'returncode': returncode,
+        'timed_out': timed_out,
+        'duration': time.perf_counter() - start,
+        'cpu_time': usage.get('cpu_time'),
+        'peak_rss_kb': usage.get('peak_rss_kb'),
+    }
+
+
+def run_programs(
+    binary, cases, time_out=1, use_pty=False, max_workers=None, limits=None
+):
+    """Run binary once per test case, several at a time, and return the
+    results in the order of the cases. Each case is a dictionary with the
+    'args' list and optionally 'stdin' and 'timeout'."""
+    if not max_workers:
+        max_workers = os.cpu_count() or 1
+
+    def run_case(case):
+        return run_program(
+            binary,
+            case.get('args', ()),
+            case.get('stdin'),
+            case.get('timeout', time_out),
+            use_pty,
+            limits,
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(in_log_context(run_case), cases))
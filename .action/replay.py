@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Record every external program the grader runs, such as git, make,
+    clang, and the students' programs, and replay the recorded results
+    later. Replaying a tape grades a submission without the toolchain and
+    at the speed of the Python code alone, which makes the grader's own
+    overhead measurable and lets a grading run be repeated exactly.
+
+    Set GRADER_EXEC_MODE to 'record' or 'replay' and GRADER_EXEC_TAPE to
+    the tape, a JSON file holding one grading job. Calls are matched by
+    what they run and their input, with the grading workspace and the
+    working directory written as {workspace} and {cwd} so that a tape
+    replays in another checkout. Identical calls are served in the order
+    they were recorded, and the last one is repeated when they run out.
+    Files a tool created, such as a binary, are made again on replay:
+    small text files with their content and anything else empty. """
+
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import threading
+from logger import setup_logger
+
+MODES = ('record', 'replay')
+# Created files up to this size are stored with their content
+MAX_FILE_BYTES = 64 * 1024
+
+_TAPE = {}
+_POSITIONS = {}
+# The paths named in the current job, see named_path()
+_PATHS = contextvars.ContextVar('grader_tape_paths', default={})
+_LOCK = threading.Lock()
+_STATE = {'loaded': False, 'registered': False}
+
+
+def exec_mode():
+    """'record', 'replay', or None from GRADER_EXEC_MODE. A mode without
+    a tape in GRADER_EXEC_TAPE is ignored."""
+    mode = os.environ.get('GRADER_EXEC_MODE') or None
+    if mode not in MODES or not tape_path():
+        return None
+    return mode
+
+
+def tape_path():
+    """The tape file from GRADER_EXEC_TAPE."""
+    return os.environ.get('GRADER_EXEC_TAPE') or None
+
+
+@contextlib.contextmanager
+def named_path(path, name):
+    """Write path as {name} on the tape in the body of the with statement,
+    e.g. a job's grading workspace. The name belongs to the job's context,
+    so jobs in one process each restore their own path."""
+    paths = dict(_PATHS.get())
+    paths[os.path.abspath(path)] = '{' + name + '}'
+    token = _PATHS.set(paths)
+    try:
+        yield path
+    finally:
+        _PATHS.reset(token)
+
+
+def _substitutions():
+    """Pairs of paths and their names, longest path first."""
+    paths = dict(_PATHS.get())
+    paths.setdefault(os.getcwd(), '{cwd}')
+    return sorted(paths.items(), key=lambda item: len(item[0]), reverse=True)
+
+
+def normalize(value, substitutions=None):
+    """Replace the named paths in the strings of value."""
+    if substitutions is None:
+        substitutions = _substitutions()
+    if isinstance(value, str):
+        for path, name in substitutions:
+            value = value.replace(path, name)
+        return value
+    if isinstance(value, (list, tuple)):
+        return [normalize(item, substitutions) for item in value]
+    if isinstance(value, dict):
+        return {key: normalize(item, substitutions) for key, item in value.items()}
+    return value
+
+
+def restore(value):
+    """Undo normalize() with the paths of this run."""
+    return normalize(value, [(name, path) for path, name in _substitutions()])
+
+
+def tape_key(kind, *parts):
+    """The key of a call on the tape."""
+    return json.dumps([kind] + normalize(list(parts)))
+
+
+def _load():
+    """Read the tape to replay once."""
+    if _STATE['loaded']:
+        return
+    _STATE['loaded'] = True
+    logger = setup_logger()
+    try:
+        with open(tape_path(), 'r', encoding='UTF-8') as file_handle:
+            _TAPE.update(json.load(file_handle)['calls'])
+    except (OSError, ValueError, KeyError) as exception:
+        logger.error('Cannot read the tape %s: %s', tape_path(), exception)
+
+
+def replayed(key):
+    """Return the next recorded result of the call key, or None when it
+    is not on the tape."""
+    logger = setup_logger()
+    with _LOCK:
+        _load()
+        results = _TAPE.get(key)
+        if not results:
+            logger.warning('Not on the tape: %s', key)
+            return None
+        position = _POSITIONS.get(key, 0)
+        _POSITIONS[key] = position + 1
+        result = results[min(position, len(results) - 1)]
+    for path, content in result.get('created', {}).items():
+        _create_file(restore(path), content)
+    return restore(result['result'])
+
+
+def record(key, result, created=None):
+    """Add the result of the call key to the tape, with the files it
+    created from created_files()."""
+    entry = {'result': normalize(result)}
+    if created:
+        entry['created'] = {
+            normalize(path): normalize(file_record)
+            for path, file_record in created.items()
+        }
+    with _LOCK:
+        _TAPE.setdefault(key, []).append(entry)
+        if not _STATE['registered']:
+            atexit.register(save_tape)
+            _STATE['registered'] = True
+
+
+def save_tape():
+    """Write the recorded calls to the tape, replacing it."""
+    with _LOCK:
+        calls = dict(_TAPE)
+    temporary = f'{tape_path()}.{os.getpid()}'
+    with open(temporary, 'w', encoding='UTF-8') as file_handle:
+        json.dump({'calls': calls}, file_handle, indent=1)
+    os.replace(temporary, tape_path())
+
+
+def list_files(directories, paths=()):
+    """Snapshot the files below directories, skipping .git, and the files
+    paths as a dictionary of path to modification time."""
+    files = {}
+    for path in paths:
+        try:
+            files[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    for directory in directories:
+        for root, dirs, names in os.walk(directory):
+            if '.git' in dirs:
+                dirs.remove('.git')
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    files[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+    return files
+
+
+def created_files(before, directories, paths=()):
+    """Return the files below directories and the files paths that are new
+    or changed since the snapshot before, as a dictionary of path to the
+    file's content, or None for files made empty on replay, and its
+    mode."""
+    created = {}
+    for path, mtime in list_files(directories, paths).items():
+        if before.get(path) == mtime:
+            continue
+        content = None
+        try:
+            if os.path.getsize(path) <= MAX_FILE_BYTES:
+                with open(path, 'r', encoding='UTF-8') as file_handle:
+                    content = file_handle.read()
+        except (OSError, UnicodeDecodeError):
+            pass
+        created[path] = {'content': content, 'mode': os.stat(path).st_mode & 0o777}
+    return created
+
+
+def _create_file(path, file_record):
+    """Make a file recorded by created_files()."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='UTF-8') as file_handle:
+        file_handle.write(restore(file_record['content'] or ''))
+    os.chmod(path, file_record['mode'])
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Run student programs with limits on CPU time, memory, processes, and
+    file size, in a process group of their own so that a timeout kills
+    the program together with everything it started.
+
+    Run as a script, this file is the launcher that does so without
+    running Python code between fork() and exec() in the grader, which
+    is unsafe while other threads run. The launcher applies the limits to
+    itself, then execs the program, or, with a report file, forks the
+    program, reaps it, and writes the program's CPU time and peak memory
+    to the file before exiting as the program did. Linux carries a
+    process's peak memory over fork() and exec(), so a program started by
+    the grader directly would report the grader's size; started by the
+    small launcher it reports its own, or the launcher's few megabytes
+    when it is smaller.
+
+    ex.
+    python3 -I -S sandbox.py --limit cpu_seconds=10 --report REPORT -- PROGRAM
+"""
+
+import os
+import resource
+import signal
+import sys
+
+# The limits a student program runs with unless the lab sets its own.
+# The process limit applies to all processes of the user running the
+# grader, not only the program's, so it has to leave room for the
+# grader's other jobs.
+DEFAULT_LIMITS = {
+    # Seconds of CPU time, after which the program gets SIGXCPU then SIGKILL
+    'cpu_seconds': 10,
+    # Bytes of address space; allocations beyond it fail
+    'memory_bytes': 1024 * 1024 * 1024,
+    'processes': 512,
+    # Bytes any one file the program writes may grow to
+    'file_size_bytes': 16 * 1024 * 1024,
+    # Bytes of the program's output the grader keeps, see capture.py
+    'output_bytes': 1024 * 1024,
+}
+
+# The resource each limit sets
+_RLIMITS = {
+    'cpu_seconds': resource.RLIMIT_CPU,
+    'memory_bytes': resource.RLIMIT_AS,
+    'processes': resource.RLIMIT_NPROC,
+    'file_size_bytes': resource.RLIMIT_FSIZE,
+}
+
+
+def resolve_limits(limits=None):
+    """Return DEFAULT_LIMITS updated with limits. A limit of None leaves
+    that resource unlimited."""
+    resolved = DEFAULT_LIMITS.copy()
+    resolved.update(limits or {})
+    return resolved
+
+
+def launcher_argv(argv, limits=None, report_path=None):
+    """Return the command line that runs argv under the launcher with the
+    resource limits in the dictionary limits, e.g. resolve_limits(), and
+    that writes argv's usage to report_path when given. Start it with
+    start_new_session=True to give it a process group of its own."""
+    command = [sys.executable, '-I', '-S', os.path.abspath(__file__)]
+    for name, value in (limits or {}).items():
+        if value is not None and name in _RLIMITS:
+            command += ['--limit', f'{name}={value}']
+    if report_path:
+        command += ['--report', report_path]
+    return command + ['--'] + list(argv)
+
+
+def launched_program(command):
+    """Return the program's command line from a launcher_argv() command,
+    or command when it is not one."""
+    if list(command[1:4]) == ['-I', '-S', os.path.abspath(__file__)]:
+        return list(command[list(command).index('--') + 1:])
+    return command
+
+
+def apply_limits(limits):
+    """Apply the resource limits in the dictionary limits to this
+    process; its children inherit them."""
+    for name, value in limits.items():
+        if value is None or name not in _RLIMITS:
+            continue
+        # CPU time gets a second of grace between the soft limit's
+        # SIGXCPU and the hard limit's SIGKILL.
+        soft, hard = value, value + 1 if name == 'cpu_seconds' else value
+        _, current_hard = resource.getrlimit(_RLIMITS[name])
+        if current_hard != resource.RLIM_INFINITY:
+            soft, hard = min(soft, current_hard), min(hard, current_hard)
+        resource.setrlimit(_RLIMITS[name], (soft, hard))
+
+
+def kill_process_group(pid):
+    """Kill every process in the process group led by pid. The program
+    may already have exited, and its group with it."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _exec(argv):
+    """Replace this process with argv, exiting with 127 as a shell would
+    when it cannot be run."""
+    try:
+        os.execvp(argv[0], argv)
+    except OSError as exception:
+        os.write(2, f'{argv[0]}: {exception}\n'.encode('UTF-8'))
+    os._exit(127)
+
+
+def _launch(argv, limits, report_path=None):
+    """Run argv with limits and, with report_path, write its usage there
+    and exit with its status, see the module's docstring."""
+    apply_limits(limits)
+    if not report_path:
+        _exec(argv)
+    pid = os.fork()
+    if pid == 0:
+        _exec(argv)
+    _, status, rusage = os.wait4(pid, 0)
+    with open(report_path, 'w', encoding='UTF-8') as file_handle:
+        file_handle.write(
+            f'{rusage.ru_utime + rusage.ru_stime} {rusage.ru_maxrss}\n'
+        )
+    if os.WIFSIGNALED(status):
+        # End the same way so the grader sees the signal. SIGKILL and
+        # SIGSTOP cannot be caught, so they need no default handler; a
+        # signal that does not end this process exits as a shell would.
+        number = os.WTERMSIG(status)
+        if number not in (signal.SIGKILL, signal.SIGSTOP):
+            signal.signal(number, signal.SIG_DFL)
+        os.kill(os.getpid(), number)
+        os._exit(128 + number)
+    os._exit(os.waitstatus_to_exitcode(status) & 0xFF)
+
+
+if __name__ == '__main__':
+    _args = sys.argv[1:]
+    _limits = {}
+    _report_path = None
+    while _args and _args[0] != '--':
+        if len(_args) < 2 or _args[0] not in ('--limit', '--report'):
+            sys.stderr.write(
+                f'Usage: {sys.argv[0]} [--limit NAME=VALUE]... [--report FILE]'
+                ' -- PROGRAM [ARGS...]\n'
+            )
+            sys.exit(2)
+        if _args[0] == '--limit':
+            _name, _value = _args[1].split('=', 1)
+            _limits[_name] = int(_value)
+        else:
+            _report_path = _args[1]
+        _args = _args[2:]
+    if len(_args) < 2:
+        sys.stderr.write(f'{sys.argv[0]}: no program to run\n')
+        sys.exit(2)
+    _launch(_args[1:], _limits, _report_path)
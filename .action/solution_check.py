@@ -26,19 +26,21 @@
 #
 """ Check student's submission; requires the main file and the
     template file from the original repository. """
-# pexpect documentation
-#  https://pexpect.readthedocs.io/en/stable/index.html
-
 # ex.
 # .action/solution_check_p1.py  part-1 asgt
 
-import io
+import functools
 import logging
 import sys
 import os
 import re
-import pexpect
 from assessment import csv_solution_check_make
+from gradelog import default_gradelog_db
+from calibration import effective_timeout, timing_factor
+from differential import differential_test
+from oracle import oracle_reference
+from program_runner import run_programs
+from tracing import span
 from logger import setup_logger
 
 import lab_config as cfg
@@ -49,213 +51,164 @@ def regex_it(s):
     s = s.replace(' ', '\\s+').replace('\n', '\\s+')
     return f'\\s*{s}\\s*'
 
-def run_p1(binary):
-    """Run part-1"""
-    logger = setup_logger()
-    status = []
-    error_values = (
-        [], # 0 arguments, too few
-        ['ham'], # 1 arguments, too few
-        ['ham', 'rye'], # 2 arguments, too few
-        ['ham', 'rye', 'tomato', 'lettuce'], # 4 arguments, too many
-    )
-    for index, val in enumerate(error_values):
-        test_number = index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p1_error(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-    
-    values = (
-                ['ham', 'rye', 'mayo'],
-                ['tuna', 'wheat', 'mustard'],
-                ['roast beef', 'kaiser roll', 'horse radish and mayo'],
-                ['salami', 'white', 'cheddar'],
-            )
-    for index, val in enumerate(values):
-        test_number = len(error_values) + index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p1(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-    return status
+# How a test case's expected exit code is checked
+exit_checks = {
+    'zero': lambda returncode: returncode == 0,
+    'nonzero': lambda returncode: returncode not in (0, None),
+    'any': lambda returncode: True,
+}
 
-def _run_p1_error(binary, values):
-    """The actual test with the expected input and output"""
-    logger = setup_logger()
-    status = False
-    proc = pexpect.spawn(binary, timeout=1, args=values)
 
-    try:
-        proc.expect(r'(?i)\s*error:.+')
-    except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-        logger.error('Expected: "error: you must supply three arguments"')
-        logger.error('Could not find expected output.')
-        logger.debug("%s", str(exception))
-        logger.debug(str(proc))
-        return status
+@functools.lru_cache(maxsize=None)
+def compile_expectation(pattern):
+    """Compile a test case's expected output pattern once per process."""
+    return re.compile(pattern)
 
-    proc.close()
 
-    if proc.exitstatus == 0:
-        logger.error('Expected: non-zero exit code.')
-        logger.error('Program returned zero, but non-zero is required')
-        return status
+def _log_run_failure(result):
+    """Log what the program printed and how it exited when a test fails."""
+    logger = setup_logger()
+    if result['timed_out']:
+        logger.debug('Program timed out.')
+    logger.debug('Exit code: %s', result['returncode'])
+    logger.debug('Output: %s', result['output'])
+
+
+def _squeeze(output):
+    """Collapse all runs of whitespace so output compares by its words."""
+    return ' '.join(output.split())
 
-    status = True
-    return status
 
-# based on lab 03, but modified to give input as command line arguments
-def _run_p1(binary, values):
-    """The actual test with the expected input and output"""
+def check_test(test, result, reference=None):
+    """Check a program's result against its test case. Returns True if the
+    output matches the expected pattern and the exit code is of the
+    expected kind. A test case without an 'expect' pattern expects the
+    output and kind of exit code of the reference program's result."""
     logger = setup_logger()
     status = False
-    values = list(values)
-    proc = pexpect.spawn(binary, timeout=1, args=values)
+    if result['timed_out']:
+        logger.error('Program did not finish in time.')
+        _log_run_failure(result)
+        return status
 
-    try:
-        regex = r'(?i)\s*Your\s+order.?\s+A\s+{}\s+sandwich\s+on\s+{}\s+with\s+{}.?\s*'.format(*values)
-        proc.expect(regex)
-    except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-        logger.error('Expected:"Your order:\nA {} sandwich on {} with {}."'.format(*values))
+    if 'expect' in test:
+        found = compile_expectation(test['expect']).search(result['output'])
+        expected_output = test.get('hint', test['expect'])
+        exit_class = test.get('exit', 'zero')
+    else:
+        expected = reference(test['args'], test.get('stdin'))
+        if expected['timed_out']:
+            logger.error('The reference program did not finish on this input.')
+            return status
+        found = _squeeze(result['output']) == _squeeze(expected['output'])
+        expected_output = expected['output'].strip()
+        exit_class = test.get(
+            'exit', 'zero' if expected['returncode'] == 0 else 'nonzero'
+        )
+    if not found:
+        logger.error('Expected: "%s"', expected_output)
         logger.error('Could not find expected output.')
-        logger.debug("%s", str(exception))
-        logger.debug(str(proc))
+        _log_run_failure(result)
         return status
 
-    proc.expect(pexpect.EOF)
-    proc.close()
-
-    if proc.exitstatus != 0:
-        logger.error('Expected: zero exit code.')
-        logger.error('Program returned non-zero, but zero is required')
+    if not exit_checks[exit_class](result['returncode']):
+        if exit_class == 'zero':
+            logger.error('Expected: zero exit code.')
+            logger.error('Program returned non-zero, but zero is required')
+        else:
+            logger.error('Expected: non-zero exit code.')
+            logger.error('Program returned zero, but non-zero is required')
         return status
 
     status = True
     return status
 
-def run_p2(binary):
-    """Run part-2"""
+
+def run_tests(
+    binary,
+    tests,
+    use_pty=False,
+    differential=None,
+    reference=None,
+    base_timeout=1,
+    factor=None,
+    limits=None,
+):
+    """Run every test case in the table tests against binary, many at a
+    time, and return a list with a record for each test: its number,
+    arguments, whether it passed, the timeout it ran with, and its wall
+    time. With differential settings, the program is also compared with a
+    reference over its whole input space, which counts as one more test.
+    reference looks up the expected results of an instructor's program,
+    see oracle.oracle_reference().
+    A test's timeout is its own 'timeout' or base_timeout, raised to a
+    multiple of the reference's runtime and scaled by factor, by default
+    calibration.timing_factor() sampled now. The program runs with
+    the sandbox limits limits, and each record includes its CPU time and
+    peak memory."""
     logger = setup_logger()
     status = []
-    error_values = (
-        # wrong number of arguments
-        [''],
-        ['A'],
-        ['A', 'A', 'A'],
-        # invalid card name
-        ['X', 'A'],
-        ['A', 'X'],
-        ['X', 'X'],
-    )
-    for index, val in enumerate(error_values):
+    # Compile every pattern before running anything so that a bad pattern
+    # in the configuration fails before any time is spent.
+    for test in tests:
+        if 'expect' in test:
+            compile_expectation(test['expect'])
+    if factor is None:
+        factor = timing_factor()
+    cases = []
+    for test in tests:
+        reference_runtime = None
+        if reference:
+            expected = reference(test['args'], test.get('stdin'))
+            if not expected.get('timed_out'):
+                reference_runtime = expected.get('duration')
+        cases.append(
+            dict(
+                test,
+                timeout=effective_timeout(
+                    test.get('timeout', base_timeout),
+                    reference_runtime,
+                    factor=factor,
+                ),
+            )
+        )
+    with span('test runs', tests=len(cases)):
+        results = run_programs(binary, cases, use_pty=use_pty, limits=limits)
+    for index, (case, result) in enumerate(zip(cases, results)):
         test_number = index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p2_error(binary, val)
+        logger.info('Test %d - %s', test_number, case['args'])
+        logger.debug('Timeout %.2fs', case['timeout'])
+        rv = check_test(case, result, reference)
         if not rv:
             logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-
-    values = (
-        # no ace
-        [2, 3, 5],
-        [5, 'Q', 15],
-        ['K', 'J', 20],
-        # ace counts as 11
-        ['A', '10', 21],
-        ['5', 'A', 16],
-        # ace counts as 1
-        ['A', 'A', 12],
-    )
-
-    for index, val in enumerate(values):
-        test_number = len(error_values) + index + 1
-        logger.info('Test %d - %s', test_number, val)
-        rv = _run_p2(binary, val)
-        if not rv:
-            logger.error("Did not receive expected response for test %d.", test_number)
-        status.append(rv)
-    return status
-
-def _run_p2_error(binary, values):
-    """The actual test with the expected input and output"""
-    logger = setup_logger()
-    status = False
-    values = list(map(str, values))
-    proc = pexpect.spawn(binary, timeout=1, args=values)
-
-    try:
-        proc.expect(r'(?i)\s*error:.+')
-    except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-        if len(values) != 2:
-            expected_message = 'you must supply two arguments'
-        else:
-            expected_message = 'invalid card name'
-        logger.error('Expected: "error: ' + expected_message + '"')
-        logger.error('Could not find expected output.')
-        logger.debug("%s", str(exception))
-        logger.debug(str(proc))
-        return status
-
-    proc.read()
-    proc.close()
-
-    if proc.exitstatus == 0:
-        logger.error('Expected: non-zero exit code.')
-        logger.error('Program returned zero, but non-zero is required')
-        return status
-
-    status = True
+        status.append(
+            {
+                'test': test_number,
+                'args': result['args'],
+                'passed': rv,
+                'timeout': round(case['timeout'], 3),
+                'duration': round(result['duration'], 3),
+                'cpu_time': result['cpu_time'],
+                'peak_rss_kb': result['peak_rss_kb'],
+                'truncated': result['truncated'],
+            }
+        )
+    if differential:
+        logger.info('Test %d - differential', len(tests) + 1)
+        with span('differential test'):
+            passed = differential_test(
+                binary,
+                differential['target'],
+                differential.get('random_inputs', 200),
+                differential.get('seed', 0),
+                reference=reference,
+                time_out=base_timeout,
+                factor=factor,
+                limits=limits,
+            )
+        status.append({'test': len(tests) + 1, 'args': 'differential', 'passed': passed})
     return status
 
-def _run_p2(binary, values):
-    """The actual test with the expected input and output"""
-    logger = setup_logger()
-    status = False
-    expected = values[-1]
-    proc = pexpect.spawn(binary, timeout=1, args=[str(val) for val in values[:-1]])
-    with io.BytesIO() as log_stream:
-        proc.logfile = log_stream
-        values = list(map(str, values))
-
-        try:
-            regex = r'(?i)\s*(\d+)\s*'
-            proc.expect(regex)
-        except (pexpect.exceptions.TIMEOUT, pexpect.exceptions.EOF) as exception:
-            logger.error('Expected: "' + str(expected) + '"')
-            logger.error('Could not find expected output.')
-            logger.debug("%s", str(exception))
-            logger.debug(str(proc))
-            # return status
-    
-        if proc.match and proc.match.group(1):
-            token = proc.match.group(1).decode("utf-8")
-            actual = int(token)
-            if actual != expected:
-                logger.error('Your program calculated a score of %i. The expected correct score is %i', actual, expected)
-                return status
-            else:
-                logger.debug('score matches expected value')
-        else:
-            # proc.match doesn't exist or proc.match.group(1) doesn't exist which means
-            # that the output was not close to what was expected.
-            logger.error('Computed score not found in output.')
-            logger.error('Make sure your output matches exactly what is shown in the instructions.')
-            return status
-        
-        proc.read() # regex may not have consumed all output
-        proc.close()
-
-        if proc.exitstatus != 0:
-            logger.error('Expected: zero exit code.')
-            logger.error('Program returned non-zero, but zero is required')
-            return status
-
-        status = True
-    return status
-    
 tidy_opts = (
     '-checks="*,-misc-unused-parameters,'
     '-modernize-use-trailing-return-type,-google-build-using-namespace,'
@@ -294,34 +247,52 @@ if __name__ == '__main__':
     repo_name = os.path.basename(cwd)
     td = sys.argv[1]
 
-    if sys.argv[1] == 'part-1':
-        part_config = cfg.lab['parts'][0]
-        _program_name = part_config['target']
-        _files = part_config['src'].split() + part_config['header'].split()
-        _do_format_check = part_config['do_format_check']
-        _do_lint_check = part_config['do_lint_check']
-        _do_unit_tests = part_config['do_unit_tests']
-        _tidy_options = part_config['tidy_opts']
-        _skip_compile_cmd = part_config['skip_compile_cmd']
-        # There needs to be some magic here to figure out which due date to use.
-        _lab_due_date = cfg.lab['mon_duedate'].isoformat()
-        _run_func = locals()[part_config['test_main']]
-    elif sys.argv[1] == 'part-2':
-        part_config = cfg.lab['parts'][1]
-        _program_name = part_config['target']
-        _files = part_config['src'].split() + part_config['header'].split()
-        _do_format_check = part_config['do_format_check']
-        _do_lint_check = part_config['do_lint_check']
-        _do_unit_tests = part_config['do_unit_tests']
-        _tidy_options = part_config['tidy_opts']
-        _skip_compile_cmd = part_config['skip_compile_cmd']
-        # There needs to be some magic here to figure out which due date to use.
-        _lab_due_date = cfg.lab['mon_duedate'].isoformat()
-        _run_func = locals()[part_config['test_main']]
-    else:
+    try:
+        # The part's directory is named part-N
+        part_config = cfg.lab['parts'][int(td.split('-')[-1]) - 1]
+    except (ValueError, IndexError):
         print(f'Error: {sys.argv[0]} no match.')
         sys.exit(1)
+    _program_name = part_config['target']
+    _files = part_config['src'].split() + part_config['header'].split()
+    _do_format_check = part_config['do_format_check']
+    _do_lint_check = part_config['do_lint_check']
+    _do_unit_tests = part_config['do_unit_tests']
+    _tidy_options = part_config['tidy_opts']
+    _skip_compile_cmd = part_config['skip_compile_cmd']
+    _build_profile = part_config['grade_profile']
+    _syntax_precheck = part_config['syntax_precheck']
+    _on_syntax_error = part_config['on_syntax_error']
+    _time_trace = part_config['time_trace']
+    _unittest_shards = part_config['unittest_shards']
+    _unittest_timeout = part_config['unittest_timeout']
+    _unittest_max_failures = part_config['unittest_max_failures']
+    _unittest_max_duration_ms = part_config['unittest_max_duration_ms']
+    _unittest_slow_fraction = part_config['unittest_slow_fraction']
+    _sandbox_limits = part_config['sandbox_limits']
+    # There needs to be some magic here to figure out which due date to use.
+    _lab_due_date = cfg.lab['mon_duedate'].isoformat()
+    _reference = None
+    if part_config['reference_binary']:
+        _reference = oracle_reference(
+            part_config['reference_binary'], part_config['oracle_cache']
+        )
+    # Sample the host's load before the job's builds and unit tests add
+    # to it.
+    _timing_factor = 1.0
+    if part_config['calibrate_timeouts']:
+        _timing_factor = timing_factor()
+    _run_func = functools.partial(
+        run_tests,
+        tests=part_config['tests'],
+        use_pty=part_config['use_pty'],
+        differential=part_config['differential'],
+        reference=_reference,
+        base_timeout=part_config['test_timeout'],
+        factor=_timing_factor,
+        limits=_sandbox_limits,
+    )
     # Execute the solution check
     csv_solution_check_make(
-        csv_key=repo_name, target_directory=td, program_name=_program_name, run=_run_func, files=_files, do_format_check=_do_format_check, do_lint_check=_do_lint_check, do_unit_tests=_do_unit_tests, tidy_options=_tidy_options, skip_compile_cmd=_skip_compile_cmd, lab_due_date=_lab_due_date
+        csv_key=repo_name, target_directory=td, program_name=_program_name, run=_run_func, files=_files, do_format_check=_do_format_check, do_lint_check=_do_lint_check, do_unit_tests=_do_unit_tests, tidy_options=_tidy_options, skip_compile_cmd=_skip_compile_cmd, lab_due_date=_lab_due_date, build_profile=_build_profile, syntax_precheck=_syntax_precheck, on_syntax_error=_on_syntax_error, time_trace=_time_trace, unittest_shards=_unittest_shards, unittest_timeout=_unittest_timeout, unittest_max_failures=_unittest_max_failures, unittest_max_duration_ms=_unittest_max_duration_ms, unittest_slow_fraction=_unittest_slow_fraction, sandbox_limits=_sandbox_limits, gradelog_db=default_gradelog_db(), event_log=cfg.lab['event_log']
     )
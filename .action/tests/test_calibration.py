@@ -0,0 +1,53 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of calibration.py. """
+
+import os
+
+from calibration import MAX_LOAD_FACTOR, load_factor
+
+
+def test_load_factor_is_capped(monkeypatch):
+    monkeypatch.setattr(os, 'getloadavg', lambda: (64.0, 64.0, 64.0))
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    assert load_factor() == MAX_LOAD_FACTOR
+    assert load_factor(cap=3.0) == 3.0
+
+
+def test_load_factor_bounds(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    monkeypatch.setattr(os, 'getloadavg', lambda: (0.5, 0.5, 0.5))
+    assert load_factor() == 1.0
+    monkeypatch.setattr(os, 'getloadavg', lambda: (6.0, 6.0, 6.0))
+    assert load_factor() == 1.5
+
+
+def test_load_factor_without_load_average(monkeypatch):
+    def no_load_average():
+        raise OSError
+
+    monkeypatch.setattr(os, 'getloadavg', no_load_average)
+    assert load_factor() == 1.0
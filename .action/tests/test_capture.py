@@ -0,0 +1,50 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of capture.py. """
+
+from capture import append_capture, capture_result, new_capture
+
+
+def test_capture_under_cap_keeps_everything():
+    capture = new_capture(16)
+    append_capture(capture, b'hello ')
+    append_capture(capture, b'world')
+    assert capture_result(capture) == (b'hello world', False)
+
+
+def test_capture_keeps_head_and_tail():
+    capture = new_capture(8)
+    for chunk in (b'abc', b'defghij', b'klmnop'):
+        append_capture(capture, chunk)
+    output, truncated = capture_result(capture)
+    assert truncated
+    assert output == b'abcd\n... [8 bytes truncated] ...\nmnop'
+
+
+def test_capture_without_cap():
+    capture = new_capture(None)
+    append_capture(capture, b'x' * 1000)
+    assert capture_result(capture) == (b'x' * 1000, False)
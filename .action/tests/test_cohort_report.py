@@ -0,0 +1,77 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of cohort_report.py. """
+
+import csv
+
+from cohort_report import read_rows, summarize, top_items
+from events import emit, new_event_log, render_notes
+from gradelog import GRADELOG_FIELDS
+
+
+def gradelog_row(repo, unittest_events):
+    """A gradelog row whose UnitTestNotes are rendered from events, given
+    as (status, detail) tuples, as the grader renders them."""
+    events = new_event_log(repo, 'part-1')
+    for status, detail in unittest_events:
+        emit(events, 'unittest', status, detail)
+    return {
+        'Repo Name': repo,
+        'Part': 'part-1',
+        'UnitTests': '7/8',
+        'Notes': render_notes(events['events']),
+        'UnitTestNotes': render_notes(events['events'], unittest=True),
+    }
+
+
+def test_unit_test_failures_are_counted(tmp_path):
+    failure = (
+        'BlackJack:IsAce:blackjack_unittest.cc:12: Failure\n'
+        'Expected equality of these values:\n'
+        '  IsAce("A")\n'
+        '    Which is: false'
+    )
+    rows = [
+        gradelog_row(
+            'student-1',
+            [
+                ('fail', failure),
+                ('warn', 'BlackJack:Score:took 950 ms of the 1000 ms limit'),
+            ],
+        ),
+        gradelog_row('student-2', [('fail', failure)]),
+        gradelog_row('student-3', [('info', 'Unit tests disabled.')]),
+    ]
+    assert rows[0]['UnitTestNotes'].startswith('❌ BlackJack:IsAce:')
+    path = tmp_path / 'gradelog.csv'
+    with open(path, 'w', encoding='UTF-8', newline='') as csv_handle:
+        writer = csv.DictWriter(csv_handle, GRADELOG_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    summary = summarize(read_rows([str(path)]))['All']
+    assert top_items(summary['notes'], 10) == [
+        ('❌ BlackJack:IsAce:<file>:#: Failure', 2)
+    ]
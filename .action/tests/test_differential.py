@@ -0,0 +1,68 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of differential.py. """
+
+import os
+
+from differential import find_mismatches
+
+
+def write_program(path, script):
+    """Write an executable shell script to path and return the path."""
+    path.write_text(f'#!/bin/sh\n{script}\n', encoding='UTF-8')
+    os.chmod(path, 0o755)
+    return str(path)
+
+
+def printed(output):
+    """A reference that expects output from every input."""
+    return lambda args: {'output': output, 'returncode': 0, 'timed_out': False}
+
+
+def test_runs_use_the_calibrated_timeout(tmp_path):
+    binary = write_program(tmp_path / 'slow', 'sleep 0.6; echo 21')
+    inputs = [['A', 'K']]
+    assert find_mismatches(binary, inputs, printed('21\n'), time_out=0.3) == [
+        (['A', 'K'], ('ok', 21), ('timed out',))
+    ]
+    assert not find_mismatches(
+        binary, inputs, printed('21\n'), time_out=0.3, factor=4.0
+    )
+
+
+def test_runs_use_the_reference_runtime(tmp_path):
+    binary = write_program(tmp_path / 'slow', 'sleep 0.6; echo 21')
+
+    def reference(args):
+        return {'output': '21\n', 'returncode': 0, 'timed_out': False, 'duration': 0.1}
+
+    assert not find_mismatches(binary, [['A', 'K']], reference, time_out=0.3)
+
+
+def test_runs_use_the_sandbox_limits(tmp_path):
+    binary = write_program(tmp_path / 'limits', 'ulimit -f')
+    limits = {'file_size_bytes': 7 * 512}
+    assert not find_mismatches(binary, [[]], printed('7\n'), limits=limits)
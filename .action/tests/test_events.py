@@ -0,0 +1,64 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of events.py. """
+
+import pytest
+
+from events import emit, new_event_log, read_events, render_notes
+
+
+def test_render_notes():
+    events = new_event_log('repo', 'part-1')
+    emit(events, 'build', 'pass', 'Built')
+    emit(events, 'header', 'fail', 'No header provided.', file='part-1/main.cc')
+    emit(events, 'main', 'info', 'Main function found in main.cc')
+    emit(events, 'lint', 'fail')
+    emit(events, 'unittest', 'fail', 'A:Fail:Expected 1\n  Which is: 2')
+    emit(events, 'unittest', 'warn', 'A:Slow:took 900 ms of the 1000 ms limit')
+    assert render_notes(events['events']) == (
+        '❌ No header provided.\nMain function found in main.cc\n'
+    )
+    assert render_notes(events['events'], unittest=True) == (
+        '❌ A:Fail:Expected 1\n  Which is: 2\n'
+        'A:Slow:took 900 ms of the 1000 ms limit\n'
+    )
+
+
+def test_events_are_appended_to_the_log(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    for part in ('part-1', 'part-2'):
+        events = new_event_log('repo', part, path)
+        emit(events, 'build', 'fail', 'Build failed', duration=1.23456, jobs=2)
+    logged = list(read_events([path]))
+    assert [event['part'] for event in logged] == ['part-1', 'part-2']
+    assert logged[0]['duration'] == 1.2346
+    assert logged[0]['data'] == {'jobs': 2}
+    assert logged[0]['file'] is None
+
+
+def test_unknown_status():
+    with pytest.raises(ValueError):
+        emit(new_event_log('repo', 'part-1'), 'build', 'failed')
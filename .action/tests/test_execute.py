@@ -0,0 +1,83 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of execute.py. """
+
+import subprocess
+import sys
+
+import pytest
+
+from execute import (
+    DEFAULT_TIMEOUT,
+    execute,
+    execution_summary,
+    executions,
+    reset_executions,
+    tool_name,
+    tool_timeout,
+)
+from sandbox import launcher_argv
+
+
+@pytest.fixture(autouse=True)
+def no_tape(monkeypatch):
+    """Run the programs for real and start each test's accounting anew."""
+    monkeypatch.delenv('GRADER_EXEC_MODE', raising=False)
+    reset_executions()
+
+
+def test_runs_program():
+    proc = execute(['sh', '-c', 'echo out; echo err >&2; exit 3'])
+    assert (proc.returncode, proc.stdout, proc.stderr) == (3, 'out\n', 'err\n')
+    summary = execution_summary()['sh']
+    assert (summary['count'], summary['failed'], summary['timed_out']) == (1, 1, 0)
+    assert summary['wall_time'] > 0
+
+
+def test_missing_program_exits_127():
+    proc = execute(['/nonexistent/clang-format', '--version'])
+    assert proc.returncode == 127
+    assert proc.stderr.startswith('clang-format: ')
+    assert executions()[0]['tool'] == 'clang-format'
+    assert executions()[0]['returncode'] == 127
+
+
+def test_timeout():
+    with pytest.raises(subprocess.TimeoutExpired):
+        execute(['sleep', '10'], timeout=0.3)
+    assert executions()[0]['timed_out']
+    assert execution_summary()['sleep']['timed_out'] == 1
+
+
+def test_tool_name_under_launcher():
+    assert tool_name(launcher_argv(['/usr/bin/make', 'all'])) == 'make'
+    assert tool_name([sys.executable, '-c', 'pass']) == tool_name([sys.executable])
+
+
+def test_tool_timeout():
+    assert tool_timeout('git', {'git': 3}) == 3
+    assert tool_timeout('clang-tidy') == 60
+    assert tool_timeout('no-such-tool') == DEFAULT_TIMEOUT
@@ -0,0 +1,99 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of gradelog.py. """
+
+import csv
+import os
+import threading
+
+from gradelog import (
+    GRADELOG_FIELDS,
+    export_csv,
+    gradelog_db_path,
+    history,
+    latest_runs,
+    record_run,
+)
+
+
+def row(repo, part, tests):
+    """A gradelog row of a repository's part."""
+    return {'Repo Name': repo, 'Part': part, 'Author': repo, 'Tests': tests}
+
+
+def test_history_and_latest_runs(tmp_path):
+    db_path = str(tmp_path / 'cache' / 'gradelog.sqlite')
+    record_run(db_path, row('a', 'part-1', '1/2'), 'c1', '2026-01-01T00:00:00')
+    record_run(db_path, row('a', 'part-1', '2/2'), 'c2', '2026-01-02T00:00:00')
+    record_run(db_path, row('b', 'part-1', '0/2'), None, '2026-01-01T00:00:00')
+    runs = list(history(db_path, repo='a'))
+    assert [run['Tests'] for run in runs] == ['1/2', '2/2']
+    assert [run['Commit'] for run in runs] == ['c1', 'c2']
+    latest = list(latest_runs(db_path))
+    assert [(run['Repo Name'], run['Tests']) for run in latest] == [
+        ('a', '2/2'),
+        ('b', '0/2'),
+    ]
+
+
+def test_concurrent_writers(tmp_path):
+    db_path = str(tmp_path / 'gradelog.sqlite')
+    threads = [
+        threading.Thread(
+            target=record_run, args=(db_path, row(f'repo-{number}', 'part-1', '1/1'))
+        )
+        for number in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(list(history(db_path))) == 8
+
+
+def test_export_csv(tmp_path):
+    db_path = str(tmp_path / 'gradelog.sqlite')
+    csv_path = str(tmp_path / 'gradelog.csv')
+    record_run(db_path, row('a', 'part-1', '1/2'), 'c1')
+    record_run(db_path, row('a', 'part-1', '2/2'), 'c2')
+    assert export_csv(db_path, csv_path) == 1
+    with open(csv_path, 'r', encoding='UTF-8', newline='') as csv_handle:
+        reader = csv.DictReader(csv_handle)
+        assert reader.fieldnames == GRADELOG_FIELDS + ['Graded At', 'Commit']
+        assert [line['Tests'] for line in reader] == ['2/2']
+    assert export_csv(db_path, csv_path, all_runs=True) == 2
+
+
+def test_gradelog_db_path():
+    home = os.path.expanduser('~')
+    assert gradelog_db_path('~/grades.sqlite', '/repos/a') == os.path.join(
+        home, 'grades.sqlite'
+    )
+    assert (
+        gradelog_db_path('{repo_root}/.gradelog.sqlite', '/repos/a')
+        == '/repos/a/.gradelog.sqlite'
+    )
+    assert gradelog_db_path('/srv/grades.sqlite', '/repos/a') == '/srv/grades.sqlite'
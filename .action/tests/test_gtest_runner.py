@@ -0,0 +1,86 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of gtest_runner.py. """
+
+from gtest_runner import parse_gtest_stream, split_into_shards
+
+
+def test_parse_gtest_stream():
+    lines = [
+        'Running main() from gtest_main.cc',
+        '[ RUN      ] A.Pass',
+        '[       OK ] A.Pass (3 ms)',
+        '[ RUN      ] A.Fail',
+        'a_test.cc:7: Failure',
+        'Expected equality of these values:',
+        '[  FAILED  ] A.Fail (12 ms)',
+        '[ RUN      ] B.Hang',
+    ]
+    assert list(parse_gtest_stream(lines)) == [
+        ('A.Pass', None),
+        (None, {'name': 'A.Pass', 'passed': True, 'failures': [], 'time_ms': 3}),
+        ('A.Fail', None),
+        (
+            None,
+            {
+                'name': 'A.Fail',
+                'passed': False,
+                'failures': [
+                    'a_test.cc:7: Failure\nExpected equality of these values:'
+                ],
+                'time_ms': 12,
+            },
+        ),
+        ('B.Hang', None),
+    ]
+
+
+def test_parse_gtest_stream_failure_without_message():
+    lines = ['[ RUN      ] A.Fail', '[  FAILED  ] A.Fail (0 ms)']
+    results = [result for _, result in parse_gtest_stream(lines) if result]
+    assert results[0]['failures'] == ['Failed.']
+
+
+def test_parse_gtest_stream_ignores_summary():
+    lines = [
+        '[ RUN      ] A.Fail',
+        '[  FAILED  ] A.Fail (1 ms)',
+        '[  FAILED  ] A.Fail, where GetParam() = 1',
+        '[  FAILED  ] 1 test, listed below:',
+    ]
+    results = [result for _, result in parse_gtest_stream(lines) if result]
+    assert [result['name'] for result in results] == ['A.Fail']
+
+
+def test_split_into_shards_round_robin():
+    tests = ['A', 'B', 'C', 'D', 'E']
+    assert split_into_shards(tests, 2) == [['A', 'C', 'E'], ['B', 'D']]
+
+
+def test_split_into_shards_bounds():
+    assert split_into_shards(['A', 'B'], 8) == [['A'], ['B']]
+    assert split_into_shards(['A', 'B'], 0) == [['A', 'B']]
+    assert split_into_shards([], 4) == [[]]
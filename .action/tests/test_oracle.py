@@ -0,0 +1,85 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of oracle.py. """
+
+import os
+
+import oracle
+from oracle import load_oracle, oracle_key, run_reference, save_oracle
+
+
+def write_program(path, script):
+    """Write an executable shell script to path and return the path."""
+    path.write_text(f'#!/bin/sh\n{script}\n', encoding='UTF-8')
+    os.chmod(path, 0o755)
+    return str(path)
+
+
+def test_oracle_key_stringifies_arguments():
+    assert oracle_key([1, 'two']) == oracle_key(['1', 'two'])
+
+
+def test_oracle_key_distinguishes_inputs():
+    assert oracle_key(['a b']) != oracle_key(['a', 'b'])
+    assert oracle_key(['a'], stdin='1') != oracle_key(['a'])
+    assert oracle_key(['a'], stdin='1') != oracle_key(['a'], stdin='2')
+
+
+def test_run_reference_times_out(tmp_path):
+    binary = write_program(tmp_path / 'reference', 'echo started; sleep 10')
+    result = run_reference(binary, [], time_out=0.5)
+    assert result['timed_out']
+    assert result['returncode'] is None
+    assert result['output'] == 'started\n'
+
+
+def test_timed_out_results_are_not_saved(tmp_path):
+    binary = write_program(tmp_path / 'reference', 'echo "$1"')
+    cache_path = str(tmp_path / 'reference.oracle.json')
+    finished = run_reference(binary, ['done'])
+    timed_out = dict(finished, timed_out=True, returncode=None)
+    save_oracle(
+        binary,
+        {oracle_key(['done']): finished, oracle_key(['hang']): timed_out},
+        cache_path,
+    )
+    assert load_oracle(binary, cache_path) == {oracle_key(['done']): finished}
+
+
+def test_timed_out_input_runs_once(tmp_path, monkeypatch):
+    runs = []
+
+    def fake_run_reference(reference_binary, args, stdin=None):
+        runs.append(args)
+        return {'output': '', 'returncode': None, 'timed_out': True}
+
+    monkeypatch.setattr(oracle, 'run_reference', fake_run_reference)
+    reference = oracle.oracle_reference(
+        str(tmp_path / 'reference'), str(tmp_path / 'reference.oracle.json')
+    )
+    assert reference(['hang'])['timed_out']
+    assert reference(['hang'])['timed_out']
+    assert runs == [['hang']]
@@ -0,0 +1,96 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of replay.py. """
+
+import json
+import os
+import subprocess
+import sys
+
+from replay import named_path, normalize, restore, tape_key
+
+_ACTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs the program in argv[1:] with execute() in the working directory and
+# prints the result as JSON.
+_EXECUTE = (
+    'import json, os, sys\n'
+    f'sys.path.insert(0, {_ACTION_DIR!r})\n'
+    'from execute import execute\n'
+    'proc = execute(sys.argv[1:], cwd=os.getcwd())\n'
+    'print(json.dumps([proc.returncode, proc.stdout]))\n'
+)
+
+
+def execute_in(directory, mode, tape, argv, path=None):
+    """Run argv through execute() in a new process with the tape in mode
+    and return its exit code and output."""
+    env = dict(os.environ, GRADER_EXEC_MODE=mode, GRADER_EXEC_TAPE=tape)
+    if path:
+        env['PATH'] = path
+    proc = subprocess.run(
+        [sys.executable, '-c', _EXECUTE] + argv,
+        cwd=directory,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # The grader's log, written from a queue, may come before or after it.
+    return json.loads(
+        next(line for line in proc.stdout.splitlines() if line.startswith('['))
+    )
+
+
+def test_named_path_is_scoped(tmp_path):
+    workspace = str(tmp_path / 'workspace')
+    with named_path(workspace, 'workspace'):
+        assert normalize([f'{workspace}/a.o']) == ['{workspace}/a.o']
+        assert restore('{workspace}/a.o') == f'{workspace}/a.o'
+        key = tape_key('execute', ['make', '-C', workspace])
+    assert normalize(f'{workspace}/a.o') == f'{workspace}/a.o'
+    assert key == json.dumps(['execute', ['make', '-C', '{workspace}']])
+
+
+def test_record_and_replay(tmp_path):
+    tape = str(tmp_path / 'tape.json')
+    recorded = tmp_path / 'recorded'
+    replayed = tmp_path / 'replayed'
+    recorded.mkdir()
+    replayed.mkdir()
+    script = 'pwd; echo built > program; echo run'
+    assert execute_in(str(recorded), 'record', tape, ['sh', '-c', script]) == [
+        0,
+        f'{recorded}\nrun\n',
+    ]
+    # Replaying needs neither the programs nor the recording's directory.
+    assert execute_in(
+        str(replayed), 'replay', tape, ['sh', '-c', script], path='/nonexistent'
+    ) == [0, f'{replayed}\nrun\n']
+    assert (replayed / 'program').read_text(encoding='UTF-8') == 'built\n'
+    returncode, _ = execute_in(
+        str(replayed), 'replay', tape, ['sh', '-c', 'echo other'], path='/nonexistent'
+    )
+    assert returncode == 127
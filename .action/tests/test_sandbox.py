@@ -0,0 +1,77 @@
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+""" Tests of sandbox.py's launcher. """
+
+import subprocess
+import sys
+
+from accounting import new_usage_report, read_usage_report
+from sandbox import launched_program, launcher_argv
+
+
+def launch(argv, limits=None):
+    """Run argv under the launcher with a usage report and return the
+    completed process and the usage read from the report."""
+    report_path = new_usage_report()
+    proc = subprocess.run(
+        launcher_argv(argv, limits, report_path), capture_output=True, check=False
+    )
+    return (proc, read_usage_report(report_path))
+
+
+def test_launcher_mirrors_exit_code():
+    proc, usage = launch(['sh', '-c', 'exit 3'])
+    assert proc.returncode == 3
+    assert usage is not None and usage['peak_rss_kb'] > 0
+
+
+def test_launcher_mirrors_uncatchable_signal():
+    proc, usage = launch(['sh', '-c', 'kill -9 $$'])
+    assert proc.returncode == -9
+    assert proc.stderr == b''
+    assert usage is not None
+
+
+def test_launcher_mirrors_catchable_signal():
+    proc, _ = launch(['sh', '-c', 'kill -TERM $$'])
+    assert proc.returncode == -15
+    assert proc.stderr == b''
+
+
+def test_launcher_applies_limits():
+    proc, _ = launch(['sh', '-c', 'ulimit -f'], {'file_size_bytes': 17 * 512})
+    assert proc.stdout.strip() == b'17'
+
+
+def test_launcher_cannot_run_program():
+    proc, _ = launch(['/nonexistent/program'])
+    assert proc.returncode == 127
+
+
+def test_launched_program():
+    argv = ['./blackjack', '1']
+    assert launched_program(launcher_argv(argv, {'cpu_seconds': 1})) == argv
+    assert launched_program([sys.executable, 'x.py']) == [sys.executable, 'x.py']
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+""" Summarize the compile time traces clang writes with -ftime-trace.
+    Used to tell apart submissions that are slow to compile from a
+    grader that is short on capacity. """
+
+import json
+import os.path
+from logger import setup_logger
+
+# Summary events clang adds to every trace; durations are in microseconds.
+PHASE_EVENTS = {
+    'total': 'Total ExecuteCompiler',
+    'frontend': 'Total Frontend',
+    'backend': 'Total Backend',
+}
+
+# Events worth naming individually when a file is slow to compile.
+DETAIL_EVENTS = ('Source', 'InstantiateClass', 'InstantiateFunction')
+
+
+def time_trace_path(build_dir, src_file):
+    """Return the path of the trace clang writes for src_file, which is
+    next to the object file: foo.cc is traced in foo.json."""
+    stem = os.path.splitext(os.path.basename(src_file))[0]
+    return os.path.join(build_dir, f'{stem}.json')
+
+
+def summarize_time_trace(trace_path, top=3):
+    """Given a clang time trace, return a dictionary with the total,
+    frontend, and backend time in seconds and the top slowest includes
+    and template instantiations as (event, detail, seconds) tuples."""
+    with open(trace_path, 'r', encoding='UTF-8') as file_handle:
+        trace = json.load(file_handle)
+    summary = {phase: 0.0 for phase in PHASE_EVENTS}
+    details = []
+    for event in trace.get('traceEvents', []):
+        name = event.get('name')
+        duration = event.get('dur', 0) / 1e6
+        for phase, phase_event in PHASE_EVENTS.items():
+            if name == phase_event:
+                summary[phase] = max(summary[phase], duration)
+        if name in DETAIL_EVENTS:
+            detail = event.get('args', {}).get('detail', '')
+            details.append((name, detail, duration))
+    details.sort(key=lambda item: item[2], reverse=True)
+    summary['slowest'] = details[:top]
+    return summary
+
+
+def collect_time_traces(build_dir, src_files, top=3):
+    """Summarize the time trace of each source file built in build_dir.
+    Files without a trace did not finish compiling and map to None."""
+    logger = setup_logger()
+    summaries = {}
+    for src_file in src_files:
+        trace_path = time_trace_path(build_dir, src_file)
+        short_name = os.path.basename(src_file)
+        if not os.path.exists(trace_path):
+            summaries[short_name] = None
+            continue
+        try:
+            summaries[short_name] = summarize_time_trace(trace_path, top)
+        except (OSError, ValueError) as exception:
+            logger.warning('Cannot read time trace %s: %s', trace_path, exception)
+            summaries[short_name] = None
+    return summaries
+
+
+def format_time_trace_summary(summaries):
+    """Return one line per source file describing where its compile time
+    went, suitable for the gradelog's notes."""
+    lines = []
+    total = 0.0
+    for short_name, summary in summaries.items():
+        if summary is None:
+            lines.append(f'{short_name}: did not finish compiling')
+            continue
+        total += summary['total']
+        line = (
+            f"{short_name}: {summary['total']:.2f}s "
+            f"(frontend {summary['frontend']:.2f}s, "
+            f"backend {summary['backend']:.2f}s)"
+        )
+        slowest = [
+            f'{name} {os.path.basename(detail)} {seconds:.2f}s'
+            for name, detail, seconds in summary['slowest']
+        ]
+        if slowest:
+            line = f"{line}; slowest: {', '.join(slowest)}"
+        lines.append(line)
+    lines.append(f'Total compile time {total:.2f}s')
+    return lines
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+""" Time the stages of grading and every program they run as nested
+    spans, and write them in the Chrome trace event format, which
+    chrome://tracing and https://ui.perfetto.dev open. Set GRADER_TRACE
+    to the trace file to turn tracing on; every grader process appends
+    its spans to it when it exits, so one file shows a whole fleet run. """
+
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+_SPANS = []
+_LOCK = threading.Lock()
+_STATE = {'registered': False}
+
+
+def trace_path():
+    """The trace file from GRADER_TRACE, or None when tracing is off."""
+    return os.environ.get('GRADER_TRACE') or None
+
+
+def _record(event):
+    """Keep an event until the process exits."""
+    with _LOCK:
+        _SPANS.append(event)
+        if not _STATE['registered']:
+            atexit.register(write_trace)
+            _STATE['registered'] = True
+
+
+def name_process(name):
+    """Label this process in the trace, e.g. with the repository and part
+    it grades."""
+    if not trace_path():
+        return
+    _record(
+        {
+            'name': 'process_name',
+            'ph': 'M',
+            'pid': os.getpid(),
+            'tid': threading.get_native_id(),
+            'args': {'name': name},
+        }
+    )
+
+
+@contextlib.contextmanager
+def span(name, category='stage', **args):
+    """Time the body of the with statement as a span. Spans on the same
+    thread nest by time; args are shown with the span."""
+    if not trace_path():
+        yield
+        return
+    # Wall clock time lines up the spans of different processes.
+    start_us = time.time_ns() // 1000
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        _record(
+            {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start_us,
+                'dur': (time.perf_counter_ns() - start) // 1000,
+                'pid': os.getpid(),
+                'tid': threading.get_native_id(),
+                'args': args,
+            }
+        )
+
+
+def command_label(args):
+    """A short span name for a subprocess's command."""
+    if isinstance(args, str):
+        return args[:80]
+    args = [str(arg) for arg in args]
+    if len(args) == 1 and ' ' in args[0]:
+        # A shell command line
+        return args[0][:80]
+    return ' '.join([os.path.basename(args[0])] + args[1:3])[:80]
+
+
+def write_trace(path=None):
+    """Append this process's spans to the trace file. The file is a JSON
+    array whose closing bracket is left out, which the trace format
+    allows, so that many processes can append to it."""
+    path = path or trace_path()
+    with _LOCK:
+        spans = list(_SPANS)
+        _SPANS.clear()
+    if not path or not spans:
+        return
+    data = ''.join(json.dumps(event) + ',\n' for event in spans).encode('UTF-8')
+    flags = os.O_WRONLY | os.O_APPEND
+    try:
+        # The process that creates the file opens the array.
+        file_descriptor = os.open(path, flags | os.O_CREAT | os.O_EXCL, 0o644)
+        data = b'[\n' + data
+    except FileExistsError:
+        file_descriptor = os.open(path, flags)
+    try:
+        # A single write per process keeps the lines of processes apart.
+        os.write(file_descriptor, data)
+    finally:
+        os.close(file_descriptor)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#
+# Copyright 2021-2023 Michael Shafae
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+
+""" Compare unit test timings across a cohort's gradelogs to find the
+    solutions that are pathologically slow before they hit the timeout.
+
+    ex.
+    .action/unittest_timing.py path/to/clones/*/.*_gradelog.csv
+"""
+
+import csv
+import json
+import math
+import statistics
+import sys
+from logger import setup_logger
+
+
+def read_unittest_times(csv_paths):
+    """Yield (author, test name, milliseconds) for every timed unit test
+    in the given gradelogs."""
+    for csv_path in csv_paths:
+        with open(csv_path, 'r', encoding='UTF-8', newline='') as csv_handle:
+            for row in csv.DictReader(csv_handle):
+                if not row.get('UnitTestTimes'):
+                    continue
+                times = json.loads(row['UnitTestTimes'])
+                for test, milliseconds in times.items():
+                    if milliseconds is not None:
+                        yield (row.get('Author', ''), test, milliseconds)
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction of a sorted list using the
+    nearest-rank method."""
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def timing_distribution(timings, outlier_factor=3.0):
+    """Given (author, test, milliseconds) tuples, return a dictionary per
+    test with the count, median, 95th percentile, and maximum time, and
+    the authors whose time is more than outlier_factor times the median."""
+    per_test = {}
+    for author, test, milliseconds in timings:
+        per_test.setdefault(test, []).append((milliseconds, author))
+    distribution = {}
+    for test, samples in per_test.items():
+        values = sorted(milliseconds for milliseconds, _ in samples)
+        median = statistics.median(values)
+        distribution[test] = {
+            'count': len(values),
+            'p50': median,
+            'p95': percentile(values, 0.95),
+            'max': values[-1],
+            'outliers': sorted(
+                author
+                for milliseconds, author in samples
+                if milliseconds > outlier_factor * max(median, 1)
+            ),
+        }
+    return distribution
+
+
+def main():
+    """Print the timing distribution of every unit test in the gradelogs
+    given on the command line."""
+    logger = setup_logger()
+    if len(sys.argv) < 2:
+        logger.error('Provide one or more gradelog CSV files.')
+        sys.exit(1)
+    distribution = timing_distribution(read_unittest_times(sys.argv[1:]))
+    print(f"{'Test':40} {'N':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}  Slow")
+    for test, stats in sorted(distribution.items()):
+        print(
+            f"{test:40} {stats['count']:>5} {stats['p50']:>8} "
+            f"{stats['p95']:>8} {stats['max']:>8}  {' '.join(stats['outliers'])}"
+        )
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()